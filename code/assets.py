@@ -0,0 +1,152 @@
+import json
+from os.path import getmtime, exists, relpath, splitext
+from threading import Thread
+from settings import *
+
+ATLAS_IMAGE = join('images', 'atlas.png')
+ATLAS_INDEX = join('images', 'atlas.json')
+
+def frame_order(key):
+    # numbered frames sort numerically, anything else by name
+    name = key.rsplit('/', 1)[-1]
+    return (0, int(name), '') if name.isdigit() else (1, 0, name)
+
+class Assets:
+    # every image under images/ is decoded once and shared, keyed by its path without extension
+    # e.g. 'player/down/0', 'gun/bullet'; frames('enemies/bat') is the numbered set of a folder
+    def __init__(self, root='images'):
+        self.root = root
+        self.surfaces = {}
+        self.masks = {}
+        self.frame_sets = {}
+        self.silhouettes = {}
+        self.raw = {}
+        self.thread = None
+        self.error = None
+
+    def sources(self):
+        for folder_path, _, file_names in walk(self.root):
+            for file_name in file_names:
+                path = join(folder_path, file_name)
+                if file_name.endswith('.png') and path not in (ATLAS_IMAGE,):
+                    yield splitext(relpath(path, self.root))[0].replace('\\', '/'), path
+
+    def atlas_is_fresh(self, sources):
+        if not (exists(ATLAS_IMAGE) and exists(ATLAS_INDEX)):
+            return False
+        built = getmtime(ATLAS_INDEX)
+        return all(getmtime(path) <= built for _, path in sources)
+
+    def decode(self):
+        # runs on the loader thread, only file decoding, no display calls
+        try:
+            sources = list(self.sources())
+            index = {}
+            if self.atlas_is_fresh(sources):
+                with open(ATLAS_INDEX) as file:
+                    index = json.load(file)
+            if index and set(index) == {key for key, _ in sources}:
+                atlas = pygame.image.load(ATLAS_IMAGE)
+                self.raw = {key: (atlas, rect) for key, rect in index.items()}
+            else:
+                self.raw = {key: (pygame.image.load(path), None) for key, path in sources}
+        except Exception as error:
+            self.error = error
+
+    def start(self):
+        self.thread = Thread(target=self.decode, daemon=True)
+        self.thread.start()
+
+    @property
+    def loading(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def wait(self, timeout):
+        # returns as soon as the loader is done, or after timeout seconds
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def finish(self):
+        # back on the main thread: convert for the display and precompute the masks
+        if self.thread is None:
+            self.decode()
+        else:
+            self.thread.join()
+            self.thread = None
+        if self.error:
+            raise self.error
+
+        converted = {}
+        for key, (surf, rect) in self.raw.items():
+            if surf not in converted:
+                converted[surf] = surf.convert_alpha()
+            self.surfaces[key] = converted[surf].subsurface(rect) if rect else converted[surf]
+            self.masks[key] = pygame.mask.from_surface(self.surfaces[key])
+        self.raw = {}
+        self.frame_sets = {}
+        self.silhouettes = {}
+
+    def image(self, key):
+        return self.surfaces[key]
+
+    def mask(self, key):
+        return self.masks[key]
+
+    def frames(self, folder):
+        if folder not in self.frame_sets:
+            keys = sorted((key for key in self.surfaces if key.rsplit('/', 1)[0] == folder), key=frame_order)
+            self.frame_sets[folder] = ([self.surfaces[key] for key in keys], [self.masks[key] for key in keys])
+        return self.frame_sets[folder][0]
+
+    def frame_masks(self, folder):
+        self.frames(folder)
+        return self.frame_sets[folder][1]
+
+    def silhouette(self, surf, mask=None):
+        # white flash of a surface, made once per surface and shared
+        if surf not in self.silhouettes:
+            silhouette = (mask or pygame.mask.from_surface(surf)).to_surface()
+            silhouette.set_colorkey('black')
+            self.silhouettes[surf] = silhouette
+        return self.silhouettes[surf]
+
+    def folders(self, parent):
+        return sorted({key[len(parent) + 1:].split('/', 1)[0] for key in self.surfaces
+                       if key.startswith(parent + '/') and key.count('/') > parent.count('/') + 1})
+
+    def build_atlas(self):
+        # shelf packing, one row at a time, tallest images first
+        # sources are converted like finish does, so colour keys become transparent pixels
+        if pygame.display.get_surface() is None:
+            pygame.display.init()
+            pygame.display.set_mode((1, 1), pygame.HIDDEN)
+        images = {key: pygame.image.load(path).convert_alpha() for key, path in self.sources()}
+        width = 1024
+        x = y = shelf = 0
+        index = {}
+        for key in sorted(images, key=lambda key: -images[key].get_height()):
+            w, h = images[key].get_size()
+            if x + w > width:
+                x, y, shelf = 0, y + shelf, 0
+            index[key] = [x, y, w, h]
+            x, shelf = x + w, max(shelf, h)
+
+        atlas = pygame.Surface((width, y + shelf), pygame.SRCALPHA)
+        for key, rect in index.items():
+            atlas.blit(images[key], rect[:2])
+        pygame.image.save(atlas, ATLAS_IMAGE)
+
+        # every packed image has to read back exactly as its own file does
+        saved = pygame.image.load(ATLAS_IMAGE).convert_alpha()
+        for key, rect in index.items():
+            if pygame.image.tobytes(saved.subsurface(rect), 'RGBA') != pygame.image.tobytes(images[key], 'RGBA'):
+                raise ValueError('%s differs in the atlas from its file' % key)
+        with open(ATLAS_INDEX, 'w') as file:
+            json.dump(index, file)
+
+assets = Assets()
+
+if __name__ == '__main__':
+    # build step: python code/assets.py, run from the repository root
+    assets.build_atlas()
+    print('built', ATLAS_IMAGE, ATLAS_INDEX)
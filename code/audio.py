@@ -0,0 +1,72 @@
+from collections import deque
+from settings import *
+from profiler import profiler
+
+class SilentSound:
+    # stands in for pygame.mixer.Sound when there is no mixer, e.g. headless simulations
+    def play(self, *args, **kwargs):
+        return None
+
+    def stop(self):
+        pass
+
+    def set_volume(self, volume):
+        pass
+
+def load_sound(path, silent=False):
+    return SilentSound() if silent else pygame.mixer.Sound(path)
+
+class Sounds:
+    # every sound effect goes through here: each category owns a fixed set of mixer channels,
+    # a sound plays on at most its voice limit of them at once, and triggers of the same sound
+    # in one tick are merged into one voice; played once per tick from flush
+    def __init__(self, silent=False):
+        self.silent = silent or not pygame.mixer.get_init()
+        self.sounds = {}  # name -> (sound, category, voices)
+        self.channels = {}  # category -> channels, oldest start first
+        self.playing = {}  # channel -> name of the sound last started on it
+        self.queued = {}  # name -> True, triggers of this tick in order
+        if not self.silent:
+            total = sum(SOUND_CHANNELS.values())
+            pygame.mixer.set_num_channels(total)
+            pygame.mixer.set_reserved(total)  # nothing outside the manager takes these
+            first = 0
+            for category, count in SOUND_CHANNELS.items():
+                self.channels[category] = deque(pygame.mixer.Channel(index) for index in range(first, first + count))
+                first += count
+
+    def load(self, name, path, category, volume=1, voices=SOUND_VOICES):
+        sound = load_sound(path, self.silent)
+        sound.set_volume(volume)
+        self.sounds[name] = (sound, category, voices)
+
+    def play(self, name):
+        if not self.silent:
+            self.queued[name] = True
+
+    def flush(self):
+        if not self.queued:
+            return
+        for name in self.queued:
+            sound, category, voices = self.sounds[name]
+            channels = self.channels[category]
+            busy = [channel for channel in channels if channel.get_busy()]
+            if sum(self.playing.get(channel) == name for channel in busy) >= voices:
+                if profiler.enabled:
+                    profiler.count('sounds dropped')
+                continue
+            # a free channel of the category, otherwise the one playing the longest
+            channel = next((channel for channel in channels if not channel.get_busy()), channels[0])
+            channels.remove(channel)
+            channels.append(channel)
+            channel.play(sound)
+            self.playing[channel] = name
+            if profiler.enabled:
+                profiler.count('sounds played')
+        self.queued.clear()
+
+    def stop(self):
+        self.queued.clear()
+        for channels in self.channels.values():
+            for channel in channels:
+                channel.stop()
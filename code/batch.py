@@ -0,0 +1,154 @@
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')  # keep stdout valid JSON
+
+import json
+import random
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from time import perf_counter
+
+from settings import *
+from controls import ScriptedControls
+from timing import game_time
+from benchmark import percentiles
+from main import Game
+
+# tunables a run can override: name -> (object on the game, None for the game itself, attribute)
+PARAMS = {
+    'gun_cooldown': (None, 'gun_cooldown'),
+    'enemy_damage': (None, 'enemy_damage'),
+    'enemy_speed': (None, 'enemy_speed'),
+    'spawn_interval': ('director', 'start_interval'),
+    'spawn_interval_min': ('director', 'min_interval'),
+    'spawn_ramp_time': ('director', 'ramp_time'),
+    'max_enemies': ('director', 'limit'),
+}
+
+class Bot:
+    # plays for the simulation: aims at the nearest enemy and walks away from the ones closing in
+    def __init__(self, flee_radius=400):
+        self.game = None
+        self.flee_radius = flee_radius
+
+    def __call__(self, frame):
+        if self.game is None:
+            return (), (WINDOW_WIDTH / 2, WINDOW_HEIGHT / 2), (False, False, False)
+        player = pygame.Vector2(self.game.player.rect.center)
+        nearest, nearest_distance = None, None
+        away = pygame.Vector2()
+        for enemy in self.game.enemy_sprites:
+            offset = pygame.Vector2(enemy.rect.center) - player
+            distance = offset.length_squared()
+            if nearest is None or distance < nearest_distance:
+                nearest, nearest_distance = offset, distance
+            if 0 < distance < self.flee_radius * self.flee_radius:
+                away -= offset / distance
+
+        keys = []
+        if away.length_squared() > 1e-8:
+            away.normalize_ip()
+            if away.x > 0.3: keys.append(pygame.K_d)
+            if away.x < -0.3: keys.append(pygame.K_a)
+            if away.y > 0.3: keys.append(pygame.K_s)
+            if away.y < -0.3: keys.append(pygame.K_w)
+        if nearest is None or not nearest_distance:
+            return keys, (WINDOW_WIDTH / 2 + 1, WINDOW_HEIGHT / 2), (False, False, False)
+        # the player is always in the middle of the screen
+        return keys, (WINDOW_WIDTH / 2 + nearest.x, WINDOW_HEIGHT / 2 + nearest.y), (True, False, False)
+
+def apply_params(game, params):
+    for name, value in params.items():
+        owner, attribute = PARAMS[name]
+        setattr(getattr(game, owner) if owner else game, attribute, value)
+    game.director.next_spawn = game.director.interval(0)
+
+def simulate(seed, params=None, seconds=120, backend=ENEMY_BACKEND):
+    # one seeded headless playthrough, ends when the player dies or after seconds of game time
+    random.seed(seed)
+    bot = Bot()
+    controls = ScriptedControls(bot)
+    game = Game(controls, backend, headless=True)
+    bot.game = game
+    apply_params(game, params or {})
+
+    tick = 1 / TICK_RATE
+    tick_times = []
+    while game.runnig and game_time.get_ticks() < seconds * 1000:
+        controls.next_frame()
+        start = perf_counter()
+        game.step(tick)
+        tick_times.append((perf_counter() - start) * 1000)
+    game.close()
+    return {
+        'seed': seed,
+        'params': params or {},
+        'died': not game.runnig,
+        'survival_time': game_time.get_ticks() / 1000,
+        'kills': game.kills,
+        'peak_enemies': game.peak_enemies,
+        'tick_ms': percentiles(tick_times),
+    }
+
+def run(job):
+    return simulate(*job)
+
+def summarize(results):
+    return {
+        'runs': len(results),
+        'deaths': sum(result['died'] for result in results),
+        'survival_time': percentiles([result['survival_time'] for result in results]),
+        'kills': percentiles([result['kills'] for result in results]),
+        'peak_enemies': percentiles([result['peak_enemies'] for result in results]),
+        'tick_ms_mean': percentiles([result['tick_ms']['mean'] for result in results]),
+        'tick_ms_p99': percentiles([result['tick_ms']['p99'] for result in results]),
+    }
+
+def batch(runs=100, param_sets=({},), seconds=120, backend=ENEMY_BACKEND, workers=None, seed=0):
+    # every parameter set gets the same seeds, so the sets differ only by their parameters
+    jobs = [(seed + run_index, params, seconds, backend) for params in param_sets for run_index in range(runs)]
+    with ProcessPoolExecutor(workers) as executor:
+        results = list(executor.map(run, jobs, chunksize=max(1, len(jobs) // (4 * (workers or os.cpu_count() or 1)))))
+    report = []
+    for index, params in enumerate(param_sets):
+        report.append({'params': params, **summarize(results[index * runs:(index + 1) * runs])})
+    return {'seconds': seconds, 'backend': backend, 'unit': 'ms for tick times, s for survival', 'sets': report}
+
+def parse_value(text):
+    return float(text) if '.' in text else int(text)
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='parallel headless playthroughs for balance and load testing, run from the repository root')
+    parser.add_argument('--runs', type=int, default=100, help='seeded runs per parameter set')
+    parser.add_argument('--seconds', type=float, default=120, help='game time limit of a run')
+    parser.add_argument('--seed', type=int, default=0, help='first seed')
+    parser.add_argument('--workers', type=int, help='processes, all cores by default')
+    parser.add_argument('--backend', choices=('sprites', 'numpy'), default=ENEMY_BACKEND)
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='fixed parameter for every run, one of: ' + ', '.join(PARAMS))
+    parser.add_argument('--sweep', action='append', default=[], metavar='NAME=V1,V2,...',
+                        help='runs every combination of the swept values')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    fixed = {}
+    for item in args.set:
+        name, value = item.split('=', 1)
+        fixed[name] = parse_value(value)
+    sweeps = []
+    for item in args.sweep:
+        name, values = item.split('=', 1)
+        sweeps.append([(name, parse_value(value)) for value in values.split(',')])
+    for name in list(fixed) + [values[0][0] for values in sweeps]:
+        if name not in PARAMS:
+            parser.error('unknown parameter %s' % name)
+    param_sets = [{**fixed, **dict(combination)} for combination in product(*sweeps)]
+
+    report = json.dumps(batch(args.runs, param_sets, args.seconds, args.backend, args.workers, args.seed), indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(report)
+    else:
+        print(report)
@@ -0,0 +1,99 @@
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')  # keep stdout valid JSON
+
+import json
+import random
+from argparse import ArgumentParser
+from math import cos, sin
+from time import perf_counter
+
+from settings import *
+from controls import ScriptedControls
+from main import Game
+
+PHASES = ('events', 'update', 'bullet_collision', 'player_collision', 'draw')
+
+def scripted_input(frame):
+    # walk a square while the mouse circles the player and the trigger stays down
+    keys = (pygame.K_d, pygame.K_s, pygame.K_a, pygame.K_w)[frame // 90 % 4]
+    angle = frame * 0.05
+    mouse_pos = (WINDOW_WIDTH / 2 + cos(angle) * 200, WINDOW_HEIGHT / 2 + sin(angle) * 200)
+    return (keys,), mouse_pos, (True, False, False)
+
+def percentiles(samples):
+    samples = sorted(samples)
+    def rank(p):
+        return samples[min(len(samples) - 1, int(p / 100 * len(samples)))]
+    return {
+        'mean': sum(samples) / len(samples),
+        'p50': rank(50),
+        'p90': rank(90),
+        'p99': rank(99),
+        'max': samples[-1],
+    }
+
+def benchmark(frames=600, enemies=100, seed=0, dt=1 / 60, backend=ENEMY_BACKEND):
+    random.seed(seed)
+    controls = ScriptedControls(scripted_input)
+    game = Game(controls, backend)
+    game.director.active = False  # the harness keeps the horde at a fixed size
+    game.director.limit = enemies
+
+    timings = {phase: [] for phase in PHASES}
+    for _ in range(frames):
+        start = perf_counter()
+        game.events()
+        while len(game.enemy_sprites) < enemies:
+            game.director.spawn()
+        timings['events'].append(perf_counter() - start)
+
+        start = perf_counter()
+        game.update(dt)
+        timings['update'].append(perf_counter() - start)
+
+        start = perf_counter()
+        game.bullet_collision()
+        timings['bullet_collision'].append(perf_counter() - start)
+
+        start = perf_counter()
+        game.player_collision()
+        game.sounds.flush()
+        timings['player_collision'].append(perf_counter() - start)
+
+        start = perf_counter()
+        game.draw()
+        timings['draw'].append(perf_counter() - start)
+
+        controls.next_frame()
+
+    pygame.quit()
+    frame_times = [sum(phase) for phase in zip(*timings.values())]
+    return {
+        'frames': frames,
+        'enemies': enemies,
+        'seed': seed,
+        'dt': dt,
+        'backend': backend,
+        'unit': 'ms',
+        'phases': {phase: percentiles([t * 1000 for t in samples]) for phase, samples in timings.items()},
+        'frame': percentiles([t * 1000 for t in frame_times]),
+    }
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='headless benchmark of the game loop, run from the repository root')
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--enemies', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dt', type=float, default=1 / 60)
+    parser.add_argument('--backend', choices=('sprites', 'numpy'), default=ENEMY_BACKEND)
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    report = json.dumps(benchmark(args.frames, args.enemies, args.seed, args.dt, args.backend), indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(report)
+    else:
+        print(report)
@@ -0,0 +1,55 @@
+from settings import *
+
+class Controls:
+    # live input, read straight from pygame
+    deterministic = False  # True when the same input can be fed again, background searches are off then
+
+    def latch(self):
+        # start of a simulation tick
+        pass
+
+    def end_tick(self, game):
+        # end of a simulation tick
+        pass
+
+    def close(self):
+        pass
+
+    def keys(self):
+        return pygame.key.get_pressed()
+
+    def mouse_pos(self):
+        return pygame.mouse.get_pos()
+
+    def mouse_pressed(self):
+        return pygame.mouse.get_pressed()
+
+class KeyState:
+    # stands in for pygame.key.get_pressed(), indexed by key constant
+    def __init__(self, pressed=()):
+        self.pressed = frozenset(pressed)
+
+    def __getitem__(self, key):
+        return key in self.pressed
+
+class ScriptedControls(Controls):
+    # input from a script(frame) -> (pressed keys, mouse position, mouse buttons)
+    deterministic = True
+
+    def __init__(self, script):
+        self.script = script
+        self.frame = 0
+        self.state = script(0)
+
+    def next_frame(self):
+        self.frame += 1
+        self.state = self.script(self.frame)
+
+    def keys(self):
+        return KeyState(self.state[0])
+
+    def mouse_pos(self):
+        return self.state[1]
+
+    def mouse_pressed(self):
+        return self.state[2]
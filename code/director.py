@@ -0,0 +1,45 @@
+from settings import *
+from timing import game_time
+from random import choice, choices
+
+class SpawnDirector:
+    # decides what spawns, where and when; the enemy is only built once its type is chosen
+    def __init__(self, create_enemy, enemy_types, spawn_positions, player, enemy_sprites):
+        self.create_enemy = create_enemy  # (pos, frames, masks, inAir) -> enemy
+        self.enemy_types = enemy_types  # [(name, frames, masks, inAir)]
+        self.weights = [ENEMY_WEIGHTS.get(name, 1) for name, *_ in enemy_types]
+        self.spawn_positions = spawn_positions
+        self.player = player
+        self.enemy_sprites = enemy_sprites
+        self.active = True
+        self.limit = MAX_ENEMIES
+        self.start_interval = SPAWN_INTERVAL
+        self.min_interval = SPAWN_INTERVAL_MIN
+        self.ramp_time = SPAWN_RAMP_TIME
+        self.next_spawn = SPAWN_INTERVAL
+        self.spawned = 0
+
+    def interval(self, time):
+        # linear ramp from start_interval down to min_interval over ramp_time
+        progress = min(time / self.ramp_time, 1)
+        return self.start_interval + (self.min_interval - self.start_interval) * progress
+
+    def spawn_position(self):
+        # prefer spawn points the player can't see
+        view = pygame.FRect(0, 0, WINDOW_WIDTH, WINDOW_HEIGHT)
+        view.center = self.player.rect.center
+        hidden = [pos for pos in self.spawn_positions if not view.collidepoint(pos)]
+        return choice(hidden or self.spawn_positions)
+
+    def spawn(self):
+        if len(self.enemy_sprites) >= self.limit:
+            return None
+        _, frames, masks, inAir = choices(self.enemy_types, self.weights)[0]
+        self.spawned += 1
+        return self.create_enemy(self.spawn_position(), frames, masks, inAir)
+
+    def update(self):
+        now = game_time.get_ticks()
+        while self.active and now >= self.next_spawn:
+            self.spawn()
+            self.next_spawn += self.interval(self.next_spawn)
@@ -1,33 +1,52 @@
-import heapq
 from settings import *
-
-# Define a heuristic function (Manhattan distance)
-def heuristic(a, b):
-    return abs(a[0] - b[0]) + abs(a[1] - b[1])  # Manhattan distance
+from math import sqrt
+from profiler import profiler
+from timing import game_time
+from assets import assets
 
 class Enemy(pygame.sprite.Sprite):
-    def __init__(self, pos, frames, groups, player, collision_sprites, grid, inAir=False):
-        super().__init__(groups)
+    def __init__(self, pos, frames, groups, player, collision_hash, pathfinder, inAir=False, masks=None, lod=None, neighbours=None, speed=350):
+        super().__init__()
+        self.pool = None  # set when the enemy comes from a Pool
+        self.rect = frames[0].get_rect(center=pos)
+        self.hitbox_rect = self.rect.inflate(-20, -40)
+        self.direction = pygame.Vector2()
+        self.reset(pos, frames, groups, player, collision_hash, pathfinder, inAir, masks, lod, neighbours, speed)
+
+    def reset(self, pos, frames, groups, player, collision_hash, pathfinder, inAir=False, masks=None, lod=None, neighbours=None, speed=350):
+        # full state of a fresh enemy, also used to recycle a pooled one, rects and vectors are reused
+        self.add(groups)
         self.player = player
-        self.player_cell = pygame.Vector2()
+        self.player_cell = None
+        self.enemy_cell = None
         self.frames, self.frames_index = frames, 0
         self.image = self.frames[self.frames_index]
+        self.masks = masks or [pygame.mask.from_surface(frame) for frame in frames]  # one mask per animation frame
+        self.mask = self.masks[self.frames_index]
         self.animation_speed = 6
-        self.rect = self.image.get_rect(center=pos)
-        self.hitbox_rect = self.rect.inflate(-20, -40)
-        self.collision_sprites = collision_sprites
-        self.direction = pygame.Vector2()
-        self.speed = 350
-        self.grid = grid  # Game map grid
+        self.rect.size = self.image.get_size()
+        self.rect.center = pos
+        self.hitbox_rect.update(self.rect)
+        self.hitbox_rect.inflate_ip(-20, -40)
+        self.collision_hash = collision_hash
+        self.direction.update(0, 0)
+        self.speed = speed
+        self.pathfinder = pathfinder  # Shared flow fields towards the player
         self.cell_size = TILE_SIZE  # Size of each grid cell
         self.path = []  # Store the path to follow
         self.inAir = inAir
         self.death_time = 0
         self.death_duration = 400
+        self.lod = lod  # LodScheduler, None ticks every time
+        self.lod_phase = lod.phase() if lod else 0
+        self.skipped = 0  # seconds since the last tick that ran
+        self.neighbours = neighbours  # NeighbourGrid of the enemies, None turns separation off
 
     def animate(self, dt):
         self.frames_index += self.animation_speed * dt
-        self.image = self.frames[int(self.frames_index) % len(self.frames)]
+        index = int(self.frames_index) % len(self.frames)
+        self.image = self.frames[index]
+        self.mask = self.masks[index]
 
     def move(self, dt):
         # get direction
@@ -36,14 +55,18 @@ class Enemy(pygame.sprite.Sprite):
         self.direction = (player_pos - enemy_pos).normalize()
 
         # update the rect position + collision
-        self.hitbox_rect.x += self.direction.x * self.speed * dt
-        self.collision('horizantal')
-        self.hitbox_rect.y += self.direction.y * self.speed * dt
-        self.collision('vertical')
+        with profiler.section('collision'):
+            previous = self.hitbox_rect.copy()
+            self.hitbox_rect.x += self.direction.x * self.speed * dt
+            self.collision('horizantal', previous)
+            previous = self.hitbox_rect.copy()
+            self.hitbox_rect.y += self.direction.y * self.speed * dt
+            self.collision('vertical', previous)
         self.rect.center = self.hitbox_rect.center
 
-    def collision(self, direction):
-        for sprite in self.collision_sprites:
+    def collision(self, direction, previous):
+        # only the obstacles around the swept hitbox can push it out
+        for sprite in self.collision_hash.query(self.hitbox_rect.union(previous)):
             if sprite.rect.colliderect(self.hitbox_rect):
                 if direction == 'horizantal':
                     if self.direction.x > 0: self.hitbox_rect.right = sprite.rect.left
@@ -53,92 +76,49 @@ class Enemy(pygame.sprite.Sprite):
                     if self.direction.y > 0: self.hitbox_rect.bottom = sprite.rect.top
 
     def destroy(self):
+        # returns whether this hit killed the enemy, a dying one can be hit again
+        alive = self.death_time == 0
+
         # start timer
-        self.death_time = pygame.time.get_ticks()
+        self.death_time = game_time.get_ticks()
 
         # change image
-        surf = pygame.mask.from_surface(self.frames[0]).to_surface()
-        surf.set_colorkey('black')
-        self.image = surf
+        self.image = assets.silhouette(self.frames[0], self.masks[0])
+        self.mask = self.masks[0]
+        return alive
 
     def death_timer(self):
-        if pygame.time.get_ticks() - self.death_time >= self.death_duration:
+        if game_time.get_ticks() - self.death_time >= self.death_duration:
             self.kill()
 
-    def get_neighbors(self, node):
-        neighbors = []
-        directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]  # 4 possible directions: up, down, left, right
-        
-        for dx, dy in directions:
-            x, y = node[0] + dx, node[1] + dy
-            if 0 <= x < len(self.grid[0]) and 0 <= y < len(self.grid):
-                if self.inAir:  # In air, can pass through danger areas
-                    if self.grid[y][x] != 1:  # 1 means obstacle
-                        neighbors.append((x, y))
-                else:  # Can't move through danger areas
-                    if self.grid[y][x] != 1 and self.grid[y][x] != 2:  # 2 means danger
-                        neighbors.append((x, y))
-        return neighbors
-
-    def a_star(self, start, goal):
-        open_set = []
-        heapq.heappush(open_set, (0, start))  # Push the start node with priority 0
-        g_score = {start: 0}  # Cost from start to current node
-        f_score = {start: heuristic(start, goal)}  # Estimated total cost from start to goal
-        previous_nodes = {start: None}  # Store the path
-
-        while open_set:
-            _, current = heapq.heappop(open_set)  # Get the node with the lowest f_score
-
-            if current == goal:  # If the goal is reached, reconstruct the path
-                break
-
-            for neighbor in self.get_neighbors(current):
-                tentative_g_score = g_score[current] + 1  # All edges have equal cost (1)
-
-                if neighbor not in g_score or tentative_g_score < g_score[neighbor]:
-                    g_score[neighbor] = tentative_g_score
-                    f_score[neighbor] = tentative_g_score + heuristic(neighbor, goal)
-                    heapq.heappush(open_set, (f_score[neighbor], neighbor))
-                    previous_nodes[neighbor] = current
-
-        # Reconstruct path from goal to start
-        path = []
-        node = goal
-        while node is not None:
-            path.append(node)
-            node = previous_nodes.get(node)
-        self.path = path[::-1]  # Reverse the path to go from start to goal
-        
-    def dijkstra(self, start, goal):
-        queue = [(0, start)]
-        distances = {start: 0}
-        previous_nodes = {start: None}
-        visited = set()
-
-        while queue:
-            current_distance, current_node = heapq.heappop(queue)
-            if current_node in visited:
-                continue
-            visited.add(current_node)
-
-            if current_node == goal:
-                break
-
-            for neighbor in self.get_neighbors(current_node):
-                new_distance = current_distance + 1
-                if neighbor not in distances or new_distance < distances[neighbor]:
-                    distances[neighbor] = new_distance
-                    previous_nodes[neighbor] = current_node
-                    heapq.heappush(queue, (new_distance, neighbor))
-
-        # Reconstruct path
-        path = []
-        node = goal
-        while node is not None:
-            path.append(node)
-            node = previous_nodes.get(node)
-        self.path = path[::-1]  # Reverse path
+    def kill(self):
+        if self.pool is not None and self.alive():
+            self.pool.release(self)
+        super().kill()
+
+    def separate(self, direction):
+        # steer away from enemies closer than SEPARATION_RADIUS, only the grid cells around us are looked at
+        # the grid is rebuilt at the start of every tick, so this sees where the others were then
+        x, y = self.rect.center
+        radius = SEPARATION_RADIUS
+        push_x = push_y = 0
+        after = False  # past ourselves in the grid, splits enemies standing on the same pixel
+        for other_x, other_y, other in self.neighbours.near(x, y):
+            dx, dy = x - other_x, y - other_y
+            distance = dx * dx + dy * dy
+            if other is self:
+                after = True
+            elif not distance:
+                push_x += 1 if after else -1
+            elif distance < radius * radius:
+                distance = sqrt(distance)
+                weight = (radius - distance) / (radius * distance)  # 1 when touching, 0 at the radius
+                push_x += dx * weight
+                push_y += dy * weight
+        if not (push_x or push_y):
+            return direction
+        steer = direction + pygame.Vector2(push_x, push_y) * SEPARATION_WEIGHT
+        return steer.normalize() if steer else direction
 
     def move_along_path(self, dt):
         if self.path:
@@ -149,6 +129,8 @@ class Enemy(pygame.sprite.Sprite):
             self.direction = (target_pos - current_pos)
             if self.direction:
                 self.direction = (target_pos - current_pos).normalize()
+            if self.neighbours is not None:
+                self.direction = self.separate(self.direction)
 
             distance = self.direction * self.speed * dt
             self.hitbox_rect.center += distance
@@ -156,10 +138,22 @@ class Enemy(pygame.sprite.Sprite):
             # If close to the next node, move to the next path step
             if current_pos.distance_to(target_pos) < self.speed * dt:
                 self.path = self.path[1:]  # Remove the first element of the path
+                if not self.path:
+                    # Read the following step straight from the flow field
+                    step = self.pathfinder.step(next_cell, self.inAir)
+                    if step is not None:
+                        self.path = [step]
 
             self.rect.center = self.hitbox_rect.center
 
     def update(self, dt):
+        # far enemies only run every few ticks, with the time they skipped
+        if self.lod:
+            self.skipped += dt
+            if not self.lod.due(self):
+                return
+            dt, self.skipped = self.skipped, 0
+
         player_cell = (self.player.rect.centerx // self.cell_size, self.player.rect.centery // self.cell_size)
         enemy_cell = (self.rect.centerx // self.cell_size, self.rect.centery // self.cell_size)
 
@@ -167,14 +161,11 @@ class Enemy(pygame.sprite.Sprite):
         if self.player_cell != player_cell or self.enemy_cell != enemy_cell:
             self.player_cell = player_cell
             self.enemy_cell = enemy_cell
-            if self.inAir:
-                # self.a_star(enemy_cell, player_cell)  # Use A* for in-air enemies
-                self.dijkstra(enemy_cell, player_cell)  # Use dijkstra for in-air enemies
-            else:
-                self.a_star(enemy_cell, player_cell)  # For non-in-air enemies (same behavior)
+            self.path = self.pathfinder.path(enemy_cell, self.inAir)
 
         if self.death_time == 0:
             self.move_along_path(dt)
-            self.animate(dt)
+            if not self.lod or self.lod.visible(self.rect):  # nobody sees the frames off screen
+                self.animate(dt)
         else:
             self.death_timer()
@@ -0,0 +1,68 @@
+from settings import *
+
+# cell values, as written by mapcache.create_grid
+OPEN = 0
+BLOCKED = 1
+DANGER = 2
+
+# walkable bits, one per movement class
+GROUND = 1
+AIR = 2
+WALKABLE = {OPEN: GROUND | AIR, BLOCKED: 0, DANGER: AIR}  # in air can pass through danger areas
+
+class Grid:
+    # obstacle grid stored row by row in one bytearray, cells[y * width + x]
+    # walkable keeps the movement bits next to it so searches test a single byte
+    def __init__(self, width, height, cells=None):
+        self.width, self.height = width, height
+        self.cells = bytearray(cells) if cells is not None else bytearray(width * height)
+        self.walkable = bytearray(WALKABLE[value] for value in self.cells)
+        self.version = 0  # bumped on every change
+        self.dirty = []  # (x, y, width, height) cell regions changed since take_dirty, the Pathfinder takes them
+
+    def inside(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def value(self, x, y):
+        return self.cells[y * self.width + x]
+
+    def can_walk(self, x, y, inAir):
+        return self.walkable[y * self.width + x] & (AIR if inAir else GROUND)
+
+    def mark(self, x, y, width, height, value):
+        # set a block of cells, clipped to the grid, only that block is touched
+        # danger never overrides blocked cells, same as mapcache.create_grid
+        left, top = max(x, 0), max(y, 0)
+        right, bottom = min(x + width, self.width), min(y + height, self.height)
+        if left >= right or top >= bottom:
+            return
+        row = bytes([value]) * (right - left)
+        bits = bytes([WALKABLE[value]]) * (right - left)
+        for cy in range(top, bottom):
+            start = cy * self.width
+            if value == DANGER:
+                row = bytes(BLOCKED if cell == BLOCKED else DANGER for cell in self.cells[start + left:start + right])
+                bits = bytes(WALKABLE[cell] for cell in row)
+            self.cells[start + left:start + right] = row
+            self.walkable[start + left:start + right] = bits
+        self.version += 1
+        self.dirty.append((left, top, right - left, bottom - top))
+
+    def mark_rect(self, rect, value):
+        # world rect, covers the same cells as mapcache.create_grid
+        left, top = int(rect.left // TILE_SIZE), int(rect.top // TILE_SIZE)
+        right, bottom = int(rect.right // TILE_SIZE), int(rect.bottom // TILE_SIZE)
+        self.mark(left, top, right - left + 1, bottom - top + 1, value)
+
+    def block(self, rect):
+        self.mark_rect(rect, BLOCKED)
+
+    def endanger(self, rect):
+        self.mark_rect(rect, DANGER)
+
+    def clear(self, rect):
+        self.mark_rect(rect, OPEN)
+
+    def take_dirty(self):
+        dirty, self.dirty = self.dirty, []
+        return dirty
@@ -1,18 +1,122 @@
 from settings import *
+from math import floor
+from profiler import profiler
 
 class Groups(pygame.sprite.Group):
     def __init__(self):
         super().__init__()
         self.dispaly_surface = pygame.display.get_surface()
         self.offset = pygame.Vector2()
-        
-    def draw(self,target_pos):
+        self.previous = {}  # sprite -> rect.topleft at the start of the current tick
+        self.drawn = {}  # dynamic sprite -> (image, screen rect) of the last frame, for dirty rects
+        self.drawn_offset = None
+
+        # static world, streamed in by the World
+        self.chunk_pixels = CHUNK_SIZE * TILE_SIZE
+        self.world = None  # World, baked ground surfaces per chunk
+        self.static_chunks = {}  # (chunk x, chunk y) -> static sprites overlapping the chunk
+
+    def chunk_range(self, rect):
+        left, top = int(rect.left // self.chunk_pixels), int(rect.top // self.chunk_pixels)
+        right, bottom = int((rect.right - 1) // self.chunk_pixels), int((rect.bottom - 1) // self.chunk_pixels)
+        return [(x, y) for x in range(left, right + 1) for y in range(top, bottom + 1)]
+
+    def add_static(self, sprite):
+        # sprites that never move are bucketed by chunk so only the visible ones get sorted
+        for chunk in self.chunk_range(sprite.rect):
+            self.static_chunks.setdefault(chunk, []).append(sprite)
+
+    def remove_static(self, sprite):
+        for chunk in self.chunk_range(sprite.rect):
+            self.static_chunks[chunk].remove(sprite)
+            if not self.static_chunks[chunk]:
+                del self.static_chunks[chunk]
+
+    def snapshot(self):
+        # called before every simulation tick so draw can blend between the last two ticks
+        self.previous = {sprite: sprite.rect.topleft for sprite in self}
+
+    def lerp_offset(self, sprite, alpha):
+        # how far to shift the current position back towards the previous tick
+        previous = self.previous.get(sprite)
+        if previous is None:
+            return 0, 0
+        current = sprite.rect.topleft
+        return (previous[0] - current[0]) * (1 - alpha), (previous[1] - current[1]) * (1 - alpha)
+
+    def draw(self,target_pos,alpha=1,dirty=False):
+        # with dirty set and the camera where it was last frame, only the areas whose sprites
+        # changed are redrawn and returned for display.update; None means the whole screen was drawn
         self.offset.x = -(target_pos[0]-WINDOW_WIDTH/2)
         self.offset.y = -(target_pos[1]-WINDOW_HEIGHT/2)
-        
-        ground_sprites = [sprite for sprite in self if hasattr(sprite,'ground')]
-        object_sprites = [sprite for sprite in self if not hasattr(sprite,'ground')]
-        
-        for layer in [ground_sprites,object_sprites]:
-            for sprite in sorted(layer,key=lambda sprite: sprite.rect.centery):
-                self.dispaly_surface.blit(sprite.image,sprite.rect.topleft + self.offset)
\ No newline at end of file
+        view_rect = pygame.FRect(-self.offset.x, -self.offset.y, WINDOW_WIDTH, WINDOW_HEIGHT)
+        visible_chunks = self.chunk_range(view_rect)
+
+        # ground, floor keeps every tile on the same pixel it had when blitted on its own
+        ground = []
+        for chunk in visible_chunks:
+            surf = self.world.ground_chunk(chunk) if self.world else None
+            if surf:
+                ground.append((surf, (floor(chunk[0] * self.chunk_pixels + self.offset.x), floor(chunk[1] * self.chunk_pixels + self.offset.y))))
+
+        # objects, static ones can span several chunks so they are deduplicated by id
+        visible_sprites = {}
+        for chunk in visible_chunks:
+            for sprite in self.static_chunks.get(chunk, ()):
+                if sprite.rect.colliderect(view_rect):
+                    visible_sprites[id(sprite)] = sprite
+        drawn = {}  # dynamic sprite -> (image, screen rect)
+        for sprite in self:
+            if sprite.rect.colliderect(view_rect):
+                visible_sprites[id(sprite)] = sprite
+
+        scene = []
+        for sprite in sorted(visible_sprites.values(),key=lambda sprite: sprite.rect.centery):
+            if alpha < 1 and sprite in self.previous:
+                dx, dy = self.lerp_offset(sprite, alpha)
+                pos = (sprite.rect.left + dx + self.offset.x, sprite.rect.top + dy + self.offset.y)
+            else:
+                pos = sprite.rect.topleft + self.offset
+            scene.append((sprite.image, pos))
+            if sprite in self:
+                drawn[sprite] = (sprite.image, pygame.Rect(floor(pos[0]) - 1, floor(pos[1]) - 1, sprite.image.get_width() + 2, sprite.image.get_height() + 2))
+
+        rects = None
+        if dirty and self.drawn_offset == tuple(self.offset):
+            rects = self.dirty_rects(drawn)
+            if len(rects) > DIRTY_RECT_LIMIT:
+                rects = None
+        self.drawn, self.drawn_offset = drawn, tuple(self.offset)
+
+        if rects is None:
+            self.dispaly_surface.fill('black')
+            self.dispaly_surface.blits(ground, False)
+            self.dispaly_surface.blits(scene, False)
+            blits = len(ground) + len(scene)
+        else:
+            # everything overlapping a changed area is drawn again, clipped to it
+            blits = 0
+            for rect in rects:
+                self.dispaly_surface.set_clip(rect)
+                self.dispaly_surface.fill('black', rect)
+                for surf, pos in ground + scene:
+                    if rect.colliderect(surf.get_rect(topleft = pos)):
+                        self.dispaly_surface.blit(surf, pos)
+                        blits += 1
+            self.dispaly_surface.set_clip(None)
+
+        if profiler.enabled:
+            profiler.count('blits', blits)
+        return rects
+
+    def dirty_rects(self, drawn):
+        # old and new screen rects of every sprite that moved, changed image, appeared or went away
+        rects = []
+        for sprite, (image, rect) in drawn.items():
+            last = self.drawn.get(sprite)
+            if last is None:
+                rects.append(rect)
+            elif last[0] is not image or last[1] != rect:
+                rects += [last[1], rect]
+        rects += [rect for sprite, (_, rect) in self.drawn.items() if sprite not in drawn]
+        return rects
@@ -0,0 +1,275 @@
+from collections import deque
+from collections.abc import Mapping
+from heapq import heappop, heappush
+from itertools import count
+from settings import *
+from profiler import profiler
+from grid import AIR, GROUND
+
+# 4 possible directions: up, down, left, right, same order as pathfinding
+DIRECTIONS = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+
+LONG_ENTRANCE = 6  # border runs at least this long get two entrances
+
+class ClusterGraph:
+    # HPA* abstract graph of one movement class
+    # the grid is cut into size x size clusters, every run of open cells along a cluster border
+    # gets one entrance: a node on each side joined by a step, and the nodes of a cluster are
+    # joined by their shortest distance inside it
+    # after the grid changes only the clusters with changed cells are redone, with their borders
+    def __init__(self, grid, inAir, size=CLUSTER_SIZE):
+        self.grid = grid
+        self.inAir = inAir
+        self.bit = AIR if inAir else GROUND
+        self.size = size
+        self.width, self.height = grid.width, grid.height
+        self.grid_version = -1
+        self.dirty = []  # (x, y, width, height) cell regions changed since the last build
+        self.build()
+
+    def walkable(self, x, y):
+        return self.grid.walkable[y * self.width + x] & self.bit
+
+    def cluster(self, cell):
+        return cell[0] // self.size, cell[1] // self.size
+
+    def bounds(self, cluster):
+        left, top = cluster[0] * self.size, cluster[1] * self.size
+        return left, top, min(left + self.size, self.width), min(top + self.size, self.height)
+
+    def borders(self, cluster):
+        # (cluster, cluster on its right or below) for every border of a cluster
+        cx, cy = cluster
+        borders = [((cx - 1, cy), cluster), (cluster, (cx + 1, cy)), ((cx, cy - 1), cluster), (cluster, (cx, cy + 1))]
+        return [(first, second) for first, second in borders if first in self.nodes and second in self.nodes]
+
+    def build(self):
+        with profiler.section('pathfinding'):
+            self.grid_version = self.grid.version
+            self.dirty = []
+            self.nodes = {}  # cluster -> [cell]
+            self.edges = {}  # cell -> [(cell, cost)]
+            self.entrances = {}  # border -> [(cell, cell across)], cells of the first cluster first
+            columns = -(-self.width // self.size)
+            rows = -(-self.height // self.size)
+            for cy in range(rows):
+                for cx in range(columns):
+                    self.nodes[(cx, cy)] = []
+            for cluster in self.nodes:
+                for border in self.borders(cluster):
+                    if border[0] == cluster:
+                        self.entrances[border] = self.find_entrances(border)
+            for cluster in self.nodes:
+                self.connect(cluster)
+
+    def update(self):
+        # rebuild what the dirty regions touch: their clusters, and the clusters across
+        # any border whose entrances moved
+        if self.grid_version == self.grid.version:
+            return
+        with profiler.section('pathfinding'):
+            self.grid_version = self.grid.version
+            dirty = set()
+            for x, y, width, height in self.dirty:
+                for cy in range(y // self.size, (y + height - 1) // self.size + 1):
+                    for cx in range(x // self.size, (x + width - 1) // self.size + 1):
+                        dirty.add((cx, cy))
+            self.dirty = []
+            changed = set(dirty)
+            for border in {border for cluster in dirty for border in self.borders(cluster)}:
+                entrances = self.find_entrances(border)
+                if entrances != self.entrances[border]:
+                    self.entrances[border] = entrances
+                    changed.update(border)
+            for cluster in sorted(changed):
+                self.connect(cluster)
+        if profiler.enabled:
+            profiler.count('clusters rebuilt', len(changed))
+
+    def find_entrances(self, border):
+        # runs of pairs open on both sides get an entrance in the middle, long runs one at each end
+        first, second = border
+        left, top, right, bottom = self.bounds(first)
+        if second[0] > first[0]:  # border with the cluster on the right
+            pairs = [((right - 1, y), (right, y)) for y in range(top, bottom)]
+        else:  # border with the cluster below
+            pairs = [((x, bottom - 1), (x, bottom)) for x in range(left, right)]
+        entrances, run = [], []
+        for a, b in pairs + [(None, None)]:
+            if a is not None and self.walkable(*a) and self.walkable(*b):
+                run.append((a, b))
+            elif run:
+                entrances += [run[0], run[-1]] if len(run) >= LONG_ENTRANCE else [run[len(run) // 2]]
+                run = []
+        return entrances
+
+    def connect(self, cluster):
+        # nodes of a cluster from the entrances on its borders, joined by their distance inside it
+        steps = {}  # node -> [(cell across, 1)]
+        for border in self.borders(cluster):
+            for a, b in self.entrances[border]:
+                node, other = (a, b) if border[0] == cluster else (b, a)
+                steps.setdefault(node, []).append((other, 1))
+        for node in self.nodes[cluster]:
+            if node not in steps:
+                del self.edges[node]
+        nodes = self.nodes[cluster] = list(steps)
+        for node in nodes:
+            distances = self.local_distances(node, cluster)
+            self.edges[node] = steps[node] + [(other, distances[other]) for other in nodes
+                                              if other != node and other in distances]
+
+    def local_distances(self, start, cluster):
+        # breadth first search that stays inside one cluster
+        left, top, right, bottom = self.bounds(cluster)
+        distances = {start: 0}
+        queue = deque([start])
+        while queue:
+            cx, cy = current = queue.popleft()
+            for dx, dy in DIRECTIONS:
+                x, y = cx + dx, cy + dy
+                if left <= x < right and top <= y < bottom and (x, y) not in distances and self.walkable(x, y):
+                    distances[(x, y)] = distances[current] + 1
+                    queue.append((x, y))
+        return distances
+
+class LocalFields(Mapping):
+    # next_cell of a HierarchicalField, a cluster is refined the first time one of its cells is read
+    def __init__(self, field):
+        self.field = field
+
+    def __getitem__(self, cell):
+        x, y = cell
+        if not (0 <= x < self.field.width and 0 <= y < self.field.height):
+            raise KeyError(cell)
+        return self.field.refine(self.field.graph.cluster(cell))[cell]
+
+    def __iter__(self):
+        for cluster in self.field.graph.nodes:
+            yield from self.field.refine(cluster)
+
+    def __len__(self):
+        return sum(len(self.field.refine(cluster)) for cluster in self.field.graph.nodes)
+
+class HierarchicalField:
+    # drop-in for FlowField on large maps: the search runs over the cluster graph and
+    # only the clusters enemies stand in are searched cell by cell
+    def __init__(self, graph, field_versions):
+        self.graph = graph
+        self.grid = graph.grid
+        self.inAir = graph.inAir
+        self.width, self.height = graph.width, graph.height
+        self.field_versions = field_versions
+        self.goal = None
+        self.next_cell = LocalFields(self)
+        self.version = 0
+        self.grid_version = -1
+        self.cost = {}  # node -> steps to the goal
+        self.toward = {}  # node -> next node towards the goal
+        self.clusters = {}  # cluster -> {cell: next cell}
+        self.searched = {}  # cluster -> ({cell: next cell}, {cell: cost}) of its own search
+
+    def walkable(self, x, y):
+        return self.graph.walkable(x, y)
+
+    def build(self, goal):
+        self.goal = goal
+        self.version = next(self.field_versions)
+        self.grid_version = self.graph.grid_version
+        self.cost, self.toward, self.clusters, self.searched = {}, {}, {}, {}
+        gx, gy = goal
+        if not (0 <= gx < self.width and 0 <= gy < self.height) or not self.walkable(gx, gy):
+            return  # nobody can step onto the goal
+
+        # Dijkstra over the abstract graph, starting from the nodes of the goal cluster
+        with profiler.section('pathfinding'):
+            order = count()
+            heap = []
+            distances = self.graph.local_distances(goal, self.graph.cluster(goal))
+            for node in self.graph.nodes[self.graph.cluster(goal)]:
+                if node in distances:
+                    self.cost[node] = distances[node]
+                    self.toward[node] = goal
+                    heappush(heap, (distances[node], next(order), node))
+            expanded = 0
+            while heap:
+                cost, _, node = heappop(heap)
+                if cost > self.cost[node]:
+                    continue
+                expanded += 1
+                for other, step in self.graph.edges[node]:
+                    if cost + step < self.cost.get(other, cost + step + 1):
+                        self.cost[other] = cost + step
+                        self.toward[other] = node
+                        heappush(heap, (cost + step, next(order), other))
+        if profiler.enabled:
+            profiler.count('searches')
+            profiler.count('nodes expanded', expanded)
+
+    def refine(self, cluster):
+        # the cluster's own search, then blocked cells on its edge that nothing inside reaches
+        # cheaper take a step across the border, so every cell gets the step a flat search gives it
+        if cluster in self.clusters:
+            return self.clusters[cluster]
+        next_cell, cost = self.search(cluster)
+        next_cell = dict(next_cell)
+        left, top, right, bottom = self.graph.bounds(cluster)
+        edge = [(x, y) for y in range(top, bottom) for x in range(left, right)
+                if (x in (left, right - 1) or y in (top, bottom - 1)) and not self.walkable(x, y)]
+        for cell in edge:
+            best = cost.get(cell)
+            for dx, dy in DIRECTIONS:
+                x, y = cell[0] + dx, cell[1] + dy
+                if (left <= x < right and top <= y < bottom) or not (0 <= x < self.width and 0 <= y < self.height):
+                    continue
+                if not self.walkable(x, y):
+                    continue
+                across = self.search(self.graph.cluster((x, y)))[1].get((x, y))
+                if across is not None and (best is None or across + 1 < best):
+                    next_cell[cell], best = (x, y), across + 1
+        self.clusters[cluster] = next_cell
+        if profiler.enabled:
+            profiler.count('clusters refined')
+        return next_cell
+
+    def search(self, cluster):
+        # Dijkstra inside one cluster, seeded with the goal and with every node whose way to the
+        # goal leaves the cluster; like a flow field, blocked cells get a step but don't expand
+        if cluster in self.searched:
+            return self.searched[cluster]
+        with profiler.section('pathfinding'):
+            left, top, right, bottom = self.graph.bounds(cluster)
+            next_cell, cost, heap, order = {}, {}, [], count()
+            if self.graph.cluster(self.goal) == cluster and self.walkable(*self.goal):
+                next_cell[self.goal], cost[self.goal] = None, 0
+                heappush(heap, (0, next(order), self.goal))
+            for node in self.graph.nodes[cluster]:
+                toward = self.toward.get(node)
+                if toward is not None and self.graph.cluster(toward) != cluster:
+                    next_cell[node], cost[node] = toward, self.cost[node]
+                    heappush(heap, (self.cost[node], next(order), node))
+            while heap:
+                current_cost, _, current = heappop(heap)
+                if current_cost > cost[current]:
+                    continue
+                cx, cy = current
+                for dx, dy in DIRECTIONS:
+                    x, y = cx + dx, cy + dy
+                    if left <= x < right and top <= y < bottom and current_cost + 1 < cost.get((x, y), current_cost + 2):
+                        next_cell[(x, y)], cost[(x, y)] = current, current_cost + 1
+                        if self.walkable(x, y):
+                            heappush(heap, (current_cost + 1, next(order), (x, y)))
+        self.searched[cluster] = next_cell, cost
+        return next_cell, cost
+
+    def path(self, start):
+        # same shape as FlowField.path
+        if start == self.goal:
+            return [start]
+        step = self.next_cell.get(start)
+        if step is None:
+            return [self.goal]
+        return [start, step]
+
+    def step(self, cell):
+        return self.next_cell.get(cell)
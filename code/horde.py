@@ -0,0 +1,234 @@
+from settings import *
+from timing import game_time
+from assets import assets
+
+try:
+    import numpy as np
+except ImportError:  # optional backend, the sprite enemies don't need it
+    np = None
+
+class HordeEnemy(pygame.sprite.Sprite):
+    # lightweight view of one horde slot, it is what groups, drawing and collisions see
+    def __init__(self, horde, index, groups):
+        super().__init__(groups)
+        self.horde = horde
+        self.index = index
+        self.image = None
+        self.rect = None
+        self.mask = None
+
+    def destroy(self):
+        return self.horde.destroy(self.index)
+
+    def kill(self):
+        if self.alive():
+            self.horde.release(self.index)
+        super().kill()
+
+class Horde:
+    # struct of arrays for every enemy, stepped in batches by numpy
+    # follows Enemy.move_along_path and Enemy.death_timer step for step
+    def __init__(self, player, pathfinder, capacity=64):
+        if np is None:
+            raise ImportError('the numpy enemy backend needs numpy installed')
+        self.player = player
+        self.pathfinder = pathfinder
+        self.cell_size = TILE_SIZE
+        self.animation_speed = 6
+        self.death_duration = 400
+        self.player_cell = None
+        self.fields = {}  # inAir -> (field version, next x array, next y array)
+
+        self.views = [None] * capacity
+        self.free = list(range(capacity - 1, -1, -1))
+        self.frame_sets = []  # (frames, masks), indexed by frame_set
+        self.frame_set_ids = {}
+
+        self.used = np.zeros(capacity, bool)
+        self.center = np.zeros((capacity, 2), np.int64)  # rect.center, integer like a Rect
+        self.speed = np.zeros(capacity)
+        self.in_air = np.zeros(capacity, bool)
+        self.cell = np.full((capacity, 2), -1, np.int64)  # enemy cell the path was made for
+        self.path = np.zeros((capacity, 2, 2), np.int64)  # at most two cells, like the flow field paths
+        self.path_length = np.zeros(capacity, np.int64)
+        self.frame_set = np.zeros(capacity, np.int64)
+        self.frame_count = np.ones(capacity, np.int64)
+        self.frames_index = np.zeros(capacity)
+        self.shown_frame = np.zeros(capacity, np.int64)
+        self.hp = np.zeros(capacity, np.int64)
+        self.death_time = np.zeros(capacity)
+
+    def __len__(self):
+        return int(self.used.sum())
+
+    def grow(self):
+        capacity = len(self.views)
+        for name in ('used', 'center', 'speed', 'in_air', 'cell', 'path', 'path_length',
+                     'frame_set', 'frame_count', 'frames_index', 'shown_frame', 'hp', 'death_time'):
+            array = getattr(self, name)
+            grown = np.zeros((capacity * 2,) + array.shape[1:], array.dtype)
+            grown[:capacity] = array
+            setattr(self, name, grown)
+        self.cell[capacity:] = -1
+        self.views.extend([None] * capacity)
+        self.free.extend(range(capacity * 2 - 1, capacity - 1, -1))
+
+    def spawn(self, pos, frames, masks, groups, inAir=False, speed=350):
+        if not self.free:
+            self.grow()
+        index = self.free.pop()
+        key = id(frames)
+        if key not in self.frame_set_ids:
+            self.frame_set_ids[key] = len(self.frame_sets)
+            self.frame_sets.append((frames, masks or [pygame.mask.from_surface(frame) for frame in frames]))
+
+        # views stay with their slot and are recycled with it
+        view = self.views[index]
+        if view is None:
+            view = self.views[index] = HordeEnemy(self, index, groups)
+        else:
+            view.add(groups)
+        view.image = frames[0]
+        view.mask = self.frame_sets[self.frame_set_ids[key]][1][0]
+        view.rect = view.image.get_rect(center=pos)
+
+        self.used[index] = True
+        self.center[index] = view.rect.center
+        self.speed[index] = speed
+        self.in_air[index] = inAir
+        self.cell[index] = -1  # forces a path on the first step
+        self.path_length[index] = 0
+        self.frame_set[index] = self.frame_set_ids[key]
+        self.frame_count[index] = len(frames)
+        self.frames_index[index] = 0
+        self.shown_frame[index] = 0
+        self.hp[index] = 1
+        self.death_time[index] = 0
+        return view
+
+    def destroy(self, index):
+        # returns whether this hit killed the enemy, like Enemy.destroy
+        alive = self.death_time[index] == 0
+
+        # start timer
+        self.hp[index] = 0
+        self.death_time[index] = game_time.get_ticks()
+
+        # change image
+        view = self.views[index]
+        frames, masks = self.frame_sets[self.frame_set[index]]
+        view.image = assets.silhouette(frames[0], masks[0])
+        view.mask = masks[0]
+        return bool(alive)
+
+    def release(self, index):
+        self.used[index] = False
+        self.free.append(index)
+
+    def field_arrays(self, inAir):
+        # the flow field as (height, width) arrays of the next cell, -1 where there is none
+        field = self.pathfinder.field(inAir)
+        cached = self.fields.get(inAir)
+        if cached is None or cached[0] != field.version:
+            next_x = np.full((field.height, field.width), -1, np.int64)
+            next_y = np.full((field.height, field.width), -1, np.int64)
+            for (x, y), step in field.next_cell.items():
+                if step is not None and 0 <= x < field.width and 0 <= y < field.height:
+                    next_x[y, x], next_y[y, x] = step
+            cached = self.fields[inAir] = (field.version, next_x, next_y)
+        return field, cached[1], cached[2]
+
+    def next_steps(self, cells, inAir):
+        if self.pathfinder.hierarchical:
+            # a cluster field is refined where it is read, so only the cells enemies are in are looked up
+            field = self.pathfinder.field(inAir)
+            steps = [field.step(cell) or (-1, -1) for cell in map(tuple, cells.tolist())]
+            return np.array(steps, np.int64).reshape(-1, 2), np.array(field.goal if field.goal is not None else (-1, -1))
+        field, next_x, next_y = self.field_arrays(inAir)
+        inside = (cells[:, 0] >= 0) & (cells[:, 0] < field.width) & (cells[:, 1] >= 0) & (cells[:, 1] < field.height)
+        steps = np.full(cells.shape, -1, np.int64)
+        steps[inside, 0] = next_x[cells[inside, 1], cells[inside, 0]]
+        steps[inside, 1] = next_y[cells[inside, 1], cells[inside, 0]]
+        return steps, np.array(field.goal if field.goal is not None else (-1, -1))
+
+    def plan(self, rows, cells):
+        # same paths as FlowField.path: [cell] at the goal, [cell, step] when reachable, else [goal]
+        for inAir in (False, True):
+            group = rows[self.in_air[rows] == inAir]
+            if not len(group):
+                continue
+            group_cells = cells[self.in_air[rows] == inAir]
+            steps, goal = self.next_steps(group_cells, inAir)
+            at_goal = (group_cells == goal).all(axis=1)
+            reachable = (steps[:, 0] >= 0) & ~at_goal
+
+            self.path[group, 0] = np.where(reachable[:, None] | at_goal[:, None], group_cells, goal)
+            self.path[group, 1] = steps
+            self.path_length[group] = np.where(reachable, 2, 1)
+            self.cell[group] = group_cells
+
+    def update(self, dt):
+        rows = np.flatnonzero(self.used)
+        if not len(rows):
+            return
+
+        # Update the path only when the enemy or player moves to a new cell
+        player_cell = (self.player.rect.centerx // self.cell_size, self.player.rect.centery // self.cell_size)
+        cells = self.center[rows] // self.cell_size
+        if player_cell != self.player_cell:
+            self.player_cell = player_cell
+            replan = np.ones(len(rows), bool)
+        else:
+            replan = (cells != self.cell[rows]).any(axis=1)
+        if replan.any():
+            self.plan(rows[replan], cells[replan])
+
+        # move along the path, living enemies only
+        moving = rows[(self.death_time[rows] == 0) & (self.path_length[rows] > 0)]
+        if len(moving):
+            current = self.center[moving].astype(float)
+            target = (self.path[moving, 0] * self.cell_size).astype(float)
+            offset = target - current
+            length = np.sqrt(offset[:, 0] * offset[:, 0] + offset[:, 1] * offset[:, 1])
+            direction = np.divide(offset, length[:, None], out=np.zeros_like(offset), where=length[:, None] > 0)
+            step = self.speed[moving] * dt
+            self.center[moving] = np.trunc(current + direction * self.speed[moving, None] * dt).astype(np.int64)
+
+            # If close to the next node, move to the next path step
+            arrived = moving[length < step]
+            if len(arrived):
+                reached = self.path[arrived, 0].copy()
+                self.path[arrived, 0] = self.path[arrived, 1]
+                self.path_length[arrived] -= 1
+                empty = arrived[self.path_length[arrived] == 0]
+                if len(empty):
+                    # Read the following step straight from the flow field
+                    reached = reached[self.path_length[arrived] == 0]
+                    for inAir in (False, True):
+                        selected = self.in_air[empty] == inAir
+                        if selected.any():
+                            steps, _ = self.next_steps(reached[selected], inAir)
+                            found = steps[:, 0] >= 0
+                            self.path[empty[selected][found], 0] = steps[found]
+                            self.path_length[empty[selected][found]] = 1
+
+        # animate
+        living = rows[self.death_time[rows] == 0]
+        self.frames_index[living] += self.animation_speed * dt
+        frame = self.frames_index[living].astype(np.int64) % self.frame_count[living]
+
+        # write back to the views, only what changed
+        for index in moving:
+            self.views[index].rect.center = tuple(self.center[index])
+        changed = frame != self.shown_frame[living]
+        for index, new_frame in zip(living[changed], frame[changed]):
+            frames, masks = self.frame_sets[self.frame_set[index]]
+            view = self.views[index]
+            view.image, view.mask = frames[new_frame], masks[new_frame]
+            self.shown_frame[index] = new_frame
+
+        # death timer
+        dying = rows[self.death_time[rows] != 0]
+        expired = dying[game_time.get_ticks() - self.death_time[dying] >= self.death_duration]
+        for index in expired:
+            self.views[index].kill()
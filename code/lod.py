@@ -0,0 +1,37 @@
+from itertools import count
+from settings import *
+from profiler import profiler
+
+class LodScheduler:
+    # level of detail for enemy ticks: the further from the player, the fewer ticks an enemy runs,
+    # each one with all the time it skipped; phases stagger the far ones over the ticks
+    def __init__(self, player):
+        self.player = player
+        self.tick = 0
+        self.phases = count()
+        self.view = pygame.FRect(0, 0, WINDOW_WIDTH, WINDOW_HEIGHT)
+
+    def begin_tick(self):
+        self.tick += 1
+        self.view.center = self.player.rect.center
+
+    def phase(self):
+        return next(self.phases)
+
+    def interval(self, rect):
+        dx = rect.centerx - self.player.rect.centerx
+        dy = rect.centery - self.player.rect.centery
+        distance = dx * dx + dy * dy
+        for radius, interval in LOD_BANDS:
+            if distance <= radius * radius:
+                return interval
+        return LOD_FAR_INTERVAL
+
+    def due(self, enemy):
+        due = (self.tick + enemy.lod_phase) % self.interval(enemy.rect) == 0
+        if due and profiler.enabled:
+            profiler.count('enemies ticked')
+        return due
+
+    def visible(self, rect):
+        return self.view.colliderect(rect)
@@ -1,21 +1,44 @@
+import os
 import pygame.locals
 from settings import *
 from player import Player
 from enemy import *
 from sprites import *
 from groups import Groups
-from pytmx.util_pygame import load_pygame
-
-from random import choice
+from pathfinding import Pathfinder
+from horde import Horde
+from pool import Pool
+from director import SpawnDirector
+from lod import LodScheduler
+from spatial import NeighbourGrid, SpatialHash, spritecollide
+from controls import Controls
+from timing import game_time
+from profiler import profiler
+from assets import assets
+from mapcache import load_map, COLLISION_AREA, DANGER_AREA, HEALTH_AREA
+from world import World
+from audio import Sounds
 
 class Game:
-    def __init__(self):
-        # setup
-        pygame.init()
-        self.display_surface = pygame.display.set_mode((WINDOW_WIDTH,WINDOW_HEIGHT))
+    def __init__(self, controls=None, enemy_backend=ENEMY_BACKEND, headless=False):
+        # setup, headless runs the simulation on the dummy video driver without the mixer
+        self.headless = headless
+        if headless:
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+            pygame.display.init()
+            pygame.font.init()
+        else:
+            pygame.init()
+        if VSYNC and not headless:
+            self.display_surface = pygame.display.set_mode((WINDOW_WIDTH,WINDOW_HEIGHT), pygame.SCALED, vsync=1)
+        else:
+            self.display_surface = pygame.display.set_mode((WINDOW_WIDTH,WINDOW_HEIGHT))
         pygame.display.set_caption('survivor')
         self.clock = pygame.time.Clock()
         self.runnig = True
+        self.controls = controls or Controls()  # live pygame input unless a script is given
+        self.enemy_backend = enemy_backend
+        game_time.reset()
         
         # groups 
         self.all_sprites = Groups()
@@ -25,21 +48,23 @@ class Game:
         self.bullet_sprites = pygame.sprite.Group()
         self.enemy_sprites = pygame.sprite.Group()
         
+        # killed bullets and enemies are recycled instead of reallocated
+        self.bullet_pool = Pool(Bullet)
+        self.enemy_pool = Pool(Enemy)
+        
         # gun timer 
         self.can_shoot = True
         self.shoot_time = 0
         self.gun_cooldown = 150
         
-        # enemy timer
-        self.enemy_event = pygame.event.custom_type()
-        pygame.time.set_timer(self.enemy_event, 5000)
+        # enemy spawn points, the SpawnDirector is set up with the map
         self.spawn_positions = []
 
         
         # audio
-        self.shoot_sound = pygame.mixer.Sound(join('audio','shoot.wav'))
-        self.shoot_sound.set_volume(0.4)
-        self.impact_sound = pygame.mixer.Sound(join('audio','impact.ogg'))
+        self.sounds = Sounds(headless)  # no mixer at all when headless
+        self.sounds.load('shoot', join('audio','shoot.wav'), 'weapons', 0.4)
+        self.sounds.load('impact', join('audio','impact.ogg'), 'impacts')
         # self.music_sound = pygame.mixer.Sound(join('audio','music.wav'))
         # self.music_sound.set_volume(0.3)
         # self.music_sound.play(loops=-1)
@@ -47,192 +72,245 @@ class Game:
         # player health setting
         self.damage_cooldown = 1200  # 1 second cooldown between damage
         self.last_damage_time = 0  # Track last damage time
+        self.enemy_damage = 20
+        self.enemy_speed = 350
+        
+        # run statistics
+        self.kills = 0
+        self.peak_enemies = 0
 
 
         # setup
+        assets.start()
+        if not headless:
+            self.loading_screen()
+        assets.finish()
         self.load_images()
         self.setup()
 
     def load_images(self):
-        self.bullet_surf = pygame.image.load(join('images','gun','bullet.png')).convert_alpha()
+        self.bullet_surf = assets.image('gun/bullet')
+        self.bullet_mask = assets.mask('gun/bullet')
         
-        folders = list(walk(join('images','enemies')))[0][1]
-        self.enemy_frames = {}
-        self.air_enemy_frames = {}
-        for folder in folders:
-            for folder_path, _, file_names in walk(join('images','enemies',folder)):
-                if folder == 'bat':
-                    self.air_enemy_frames[folder] = []
-                    for file_name in sorted(file_names, key= lambda name: int(name.split('.')[0])):
-                        full_path = join(folder_path,file_name)
-                        surf = pygame.image.load(full_path).convert_alpha()
-                        self.air_enemy_frames[folder].append(surf)
-                else:
-                    self.enemy_frames[folder] = []
-                    for file_name in sorted(file_names, key= lambda name: int(name.split('.')[0])):
-                        full_path = join(folder_path,file_name)
-                        surf = pygame.image.load(full_path).convert_alpha()
-                        self.enemy_frames[folder].append(surf)
+        # frames and their collision masks are shared by every enemy of a type
+        self.enemy_frames, self.enemy_masks = {}, {}
+        self.air_enemy_frames, self.air_enemy_masks = {}, {}
+        for folder in assets.folders('enemies'):
+            if folder == 'bat':
+                self.air_enemy_frames[folder] = assets.frames('enemies/' + folder)
+                self.air_enemy_masks[folder] = assets.frame_masks('enemies/' + folder)
+            else:
+                self.enemy_frames[folder] = assets.frames('enemies/' + folder)
+                self.enemy_masks[folder] = assets.frame_masks('enemies/' + folder)
+        
+        # death flashes are built here instead of on every kill
+        for frames, masks in zip([*self.enemy_frames.values(), *self.air_enemy_frames.values()],
+                                 [*self.enemy_masks.values(), *self.air_enemy_masks.values()]):
+            assets.silhouette(frames[0], masks[0])
+
+    def loading_screen(self):
+        # images are decoded on a worker thread while this keeps the window responsive
+        if not assets.loading:
+            return
+        font = pygame.font.Font(None, 40)
+        text = font.render('loading...', True, 'white')
+        while assets.loading:
+            pygame.event.pump()
+            self.display_surface.fill('black')
+            self.display_surface.blit(text, text.get_rect(center = (WINDOW_WIDTH / 2, WINDOW_HEIGHT / 2)))
+            pygame.display.flip()
+            assets.wait(1 / 30)
 
     def input(self):
-        if pygame.mouse.get_pressed()[0] and self.can_shoot:
-            self.shoot_sound.play()
+        if self.controls.mouse_pressed()[0] and self.can_shoot:
+            self.sounds.play('shoot')
             pos = self.gun.rect.center + self.gun.player_direction * 50
-            Bullet(self.bullet_surf, pos, self.gun.player_direction,(self.all_sprites,self.bullet_sprites))
+            self.bullet_pool.get(self.bullet_surf, pos, self.gun.player_direction,(self.all_sprites,self.bullet_sprites),self.bullet_mask)
             self.can_shoot = False
-            self.shoot_time = pygame.time.get_ticks()
+            self.shoot_time = game_time.get_ticks()
     
     def gun_timer(self):
         if not self.can_shoot:
-            current_time = pygame.time.get_ticks()
+            current_time = game_time.get_ticks()
             if current_time - self.shoot_time >= self.gun_cooldown:
                 self.can_shoot = True
     
-    def create_grid_from_sprites(self):
-        # Initialize an empty grid of 0s (all cells are passable initially)
-        grid = [[0 for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
-        
-        # Mark collision sprites as blocked (1) in the grid
-        for sprite in self.collision_sprites:
-            # Calculate the top-left and bottom-right corners in grid coordinates
-            start_x = int(sprite.rect.left // TILE_SIZE)
-            start_y = int(sprite.rect.top // TILE_SIZE)
-            end_x = int(sprite.rect.right // TILE_SIZE)
-            end_y = int(sprite.rect.bottom // TILE_SIZE)
-            
-            # Loop through each grid cell the sprite covers
-            for x in range(start_x, end_x + 1):
-                for y in range(start_y, end_y + 1):
-                    if 0 <= x < GRID_WIDTH and 0 <= y < GRID_HEIGHT:
-                        grid[y][x] = 1  # Block the grid cell
-
-        # Mark danger area sprites as danger (2) in the grid
-        for sprite in self.dangarea_sprites:
-            start_x = int(sprite.rect.left // TILE_SIZE)
-            start_y = int(sprite.rect.top // TILE_SIZE)
-            end_x = int(sprite.rect.right // TILE_SIZE)
-            end_y = int(sprite.rect.bottom // TILE_SIZE)
-            
-            for x in range(start_x, end_x + 1):
-                for y in range(start_y, end_y + 1):
-                    if 0 <= x < GRID_WIDTH and 0 <= y < GRID_HEIGHT and grid[y][x] != 1:
-                        grid[y][x] = 2  # Mark as a danger zone
-        
-        # print(grid)
-        return grid
-
-
-    
     def setup(self):
-        # self.grid = self.create_grid_from_sprites(self.collision_sprites, self.dangarea_sprites, self.GRID_WIDTH, self.GRID_HEIGHT, self.cell_size)  # Game map grid
-        
-        map = load_pygame(join('data','maps','world.tmx'))
-        for x,y,image in map.get_layer_by_name('Ground').tiles():
-            Sprite((x*TILE_SIZE, y*TILE_SIZE), image, self.all_sprites)
+        # compiled once from the TMX file and memory-mapped afterwards
+        map = load_map(join('data','maps','world.tmx'))
         
-        for obj in map.get_layer_by_name('Objects'):
-            CollisionSprite((obj.x, obj.y), obj.image, (self.all_sprites,self.collision_sprites))
-        
-        for obj in map.get_layer_by_name('Collisions'):
-            if obj.name == 'dangarea':
-                CollisionSprite((obj.x, obj.y), pygame.Surface((obj.width,obj.height)), self.dangarea_sprites)
-                # CollisionSprite((obj.x, obj.y), pygame.Surface((obj.width,obj.height)), (self.all_sprites,self.dangarea_sprites))
-            else: 
-                if obj.name == 'healtharea':
-                    CollisionSprite((obj.x, obj.y), pygame.Surface((obj.width,obj.height)), self.healtharea_sprites)
-                    # CollisionSprite((obj.x, obj.y), pygame.Surface((obj.width,obj.height)), (self.all_sprites,self.collision_sprites))
-                else:
-                    CollisionSprite((obj.x, obj.y), pygame.Surface((obj.width,obj.height)), self.collision_sprites)
-                    
+        # obstacles are indexed by tile cell, the World adds and removes them as chunks stream in and out
+        self.collision_hash = SpatialHash()
+        self.healtharea_hash = SpatialHash()
+        self.dangarea_hash = SpatialHash()
+        self.enemy_hash = SpatialHash()  # rebuilt every tick
+        # crowd separation, sprite enemies only like the LOD, the horde never reads it
+        self.neighbour_grid = NeighbourGrid(SEPARATION_RADIUS) if ENEMY_SEPARATION and self.enemy_backend == 'sprites' else None
+        self.world = World(map, map.load_images(), self.all_sprites, {
+            COLLISION_AREA: (self.collision_sprites, self.collision_hash),
+            DANGER_AREA: (self.dangarea_sprites, self.dangarea_hash),
+            HEALTH_AREA: (self.healtharea_sprites, self.healtharea_hash),
+        })
+        self.all_sprites.world = self.world
                 
-        for obj in map.get_layer_by_name('Entities'):
-            if obj.name == 'Player':
-                self.player = Player((obj.x,obj.y),self.all_sprites,self.collision_sprites)
-                self.gun = Gun(self.player,self.all_sprites)
-                self.hp_bar = HPBar(self.player,self.all_sprites)
-            else:
-                self.spawn_positions.append((obj.x, obj.y))
+        self.player = Player(map.player_pos,self.all_sprites,self.collision_hash,self.controls)
+        self.gun = Gun(self.player,self.all_sprites)
+        self.hp_bar = HPBar(self.player,self.all_sprites)
+        self.spawn_positions.extend(map.spawn_positions)
+        self.world.update(self.player.rect.center)
                 
-        self.grid = self.create_grid_from_sprites()  # Game map grid
+        self.grid = map.grid  # Game map grid, cells can be blocked at runtime with grid.block(rect)
+        self.pathfinder = Pathfinder(self.grid, None if self.controls.deterministic else PATH_WORKER)  # one flow field per movement class
+        self.horde = Horde(self.player, self.pathfinder) if self.enemy_backend == 'numpy' else None
+        self.lod = LodScheduler(self.player) if ENEMY_LOD else None  # sprite enemies only, the horde steps in one batch
+        
+        enemy_types = [(name, frames, self.enemy_masks[name], False) for name, frames in self.enemy_frames.items()]
+        enemy_types += [(name, frames, self.air_enemy_masks[name], True) for name, frames in self.air_enemy_frames.items()]
+        self.director = SpawnDirector(self.create_enemy, enemy_types, self.spawn_positions, self.player, self.enemy_sprites)
             
     def bullet_collision(self):
         if self.bullet_sprites:
             for bullet in self.bullet_sprites:
-                collision_sprites = pygame.sprite.spritecollide(bullet, self.enemy_sprites, False, pygame.sprite.collide_mask)   
+                collision_sprites = spritecollide(bullet, self.enemy_hash)   
                 if collision_sprites:
-                    self.impact_sound.play()
+                    self.sounds.play('impact')
                     for sprite in collision_sprites:
-                        sprite.destroy() 
+                        if sprite.destroy():
+                            self.kills += 1
                     bullet.kill()
     
                 
     def player_collision(self):
-        if pygame.sprite.spritecollide(self.player, self.enemy_sprites, True, pygame.sprite.collide_mask):
-            self.impact_sound.play()
-            self.player.current_hp -= 20  # Example damage value
+        if spritecollide(self.player, self.enemy_hash, True):
+            self.sounds.play('impact')
+            self.player.current_hp -= self.enemy_damage
             
-        if pygame.sprite.spritecollide(self.player, self.healtharea_sprites, False,pygame.sprite.collide_mask):
+        if spritecollide(self.player, self.healtharea_hash):
             self.player.current_hp = self.player.max_hp  # Example damage value
 
         # Check for dangerous area collision
-        current_time = pygame.time.get_ticks()
-        if pygame.sprite.spritecollide(self.player, self.dangarea_sprites, False,pygame.sprite.collide_mask):
+        current_time = game_time.get_ticks()
+        if spritecollide(self.player, self.dangarea_hash):
             if current_time - self.last_damage_time > self.damage_cooldown:
                 self.player.current_hp -= 10  # Reduce health by 10 (adjust as needed)
                 self.last_damage_time = current_time  # Update the last damage time
-                self.impact_sound.play()
+                self.sounds.play('impact')
                 
         if self.player.current_hp <= 0:
             self.runnig = False  # End the game when health reaches         
     
     
+    def create_enemy(self, pos, frames, masks, inAir):
+        if self.horde is not None:
+            return self.horde.spawn(pos, frames, masks, (self.all_sprites, self.enemy_sprites), inAir, self.enemy_speed)
+        return self.enemy_pool.get(
+            pos=pos, 
+            frames=frames,  
+            masks=masks, 
+            groups=(self.all_sprites, self.enemy_sprites),  
+            player=self.player,  
+            collision_hash=self.collision_hash, 
+            pathfinder=self.pathfinder, 
+            inAir=inAir,
+            lod=self.lod,
+            neighbours=self.neighbour_grid,
+            speed=self.enemy_speed
+        )
+    
+    def events(self):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.runnig = False
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                profiler.toggle()
+                self.all_sprites.drawn_offset = None  # one full redraw, so the overlay doesn't stay behind
+    
+    def update(self, dt):
+        game_time.advance(dt)
+        self.world.update(self.player.rect.center)
+        self.director.update()
+        self.gun_timer()
+        self.input()
+        self.pathfinder.update(self.player.rect.center)
+        if self.lod is not None:
+            self.lod.begin_tick()
+        if self.neighbour_grid is not None:
+            self.neighbour_grid.rebuild(self.enemy_sprites)
+        self.all_sprites.update(dt)
+        if self.horde is not None:
+            self.horde.update(dt)
+        self.enemy_hash.rebuild(self.enemy_sprites)
+        self.peak_enemies = max(self.peak_enemies, len(self.enemy_sprites))
+    
+    def step(self, dt):
+        # one simulation tick, everything but drawing
+        self.controls.latch()
+        self.all_sprites.snapshot()
+        with profiler.section('update'):
+            self.update(dt)
+        with profiler.section('bullet_collision'):
+            self.bullet_collision()
+        with profiler.section('player_collision'):
+            self.player_collision()
+        self.sounds.flush()
+        self.controls.end_tick(self)
+    
+    def draw(self, alpha=1):
+        # alpha is how far the frame is between the last two simulation ticks
+        dx, dy = self.all_sprites.lerp_offset(self.player, alpha)
+        # the profiler overlay changes every frame, so it always gets a full redraw
+        rects = self.all_sprites.draw((self.player.rect.centerx + dx, self.player.rect.centery + dy), alpha, DIRTY_RECTS and not profiler.enabled)
+        # self.player.draw_health_bar(self.display_surface)  # Draw health bar
+        profiler.draw(self.display_surface)
+        if rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(rects)
+    
     def run(self):
+        tick = 1 / TICK_RATE
+        accumulator = 0
         while self.runnig:
-            # dt
-            dt = self.clock.tick() / 1000
+            # frame time, capped so a stall doesn't turn into a burst of catch-up ticks
+            frame_time = self.clock.tick(0 if VSYNC else FPS_CAP) / 1000
+            accumulator += min(frame_time, MAX_FRAME_TIME)
             
             # event loop 
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    self.runnig = False
-                if event.type == self.enemy_event:
-                    choice((Enemy(
-                        pos=choice(self.spawn_positions), 
-                        frames= choice(list(self.enemy_frames.values())),  
-                        groups=(self.all_sprites, self.enemy_sprites),  
-                        player=self.player,  
-                        collision_sprites=self.collision_sprites, 
-                        grid=self.grid, 
-                        inAir=False
-                    ),
-                    Enemy(
-                        pos=choice(self.spawn_positions), 
-                        frames= choice(list(self.air_enemy_frames.values())),  
-                        groups=(self.all_sprites, self.enemy_sprites),  
-                        player=self.player,  
-                        collision_sprites=self.collision_sprites, 
-                        grid=self.grid, 
-                        inAir=True
-                    )
-                    ))
+            with profiler.section('events'):
+                self.events()
                     
-                # Enemy(choice(self.spawn_positions),choice(list(self.enemy_frames.values())), (self.all_sprites, self.enemy_sprites), self.player, self.collision_sprites)
-                    
-            # update 
-            self.gun_timer()
-            self.input()
-            self.all_sprites.update(dt)
-            self.bullet_collision()
-            self.player_collision()
+            # update, in fixed steps whatever the render rate is
+            while accumulator >= tick and self.runnig:
+                self.step(tick)
+                accumulator -= tick
             
             # draw
-            self.display_surface.fill('black')
-            self.all_sprites.draw(self.player.rect.center)
-            # self.player.draw_health_bar(self.display_surface)  # Draw health bar
-            pygame.display.flip()
+            with profiler.section('draw'):
+                self.draw(accumulator / tick)
+            if profiler.enabled:
+                profiler.gauge('bullet pool', len(self.bullet_pool.dormant))
+                profiler.gauge('enemy pool', len(self.horde.free) if self.horde is not None else len(self.enemy_pool.dormant))
+            profiler.end_frame()
             
+        self.close()
         pygame.quit()
+    
+    def close(self):
+        # background workers and the trace file, pygame itself stays up
+        self.pathfinder.close()
+        self.world.close()
+        self.controls.close()
+        self.sounds.stop()
+        profiler.close()
         
 if __name__ == '__main__':
-    game = Game()
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description='play, run from the repository root')
+    parser.add_argument('--record', metavar='FILE', help='record the session for code/replay.py')
+    args = parser.parse_args()
+    if args.record:
+        from replay import Recorder
+        game = Game(Recorder(args.record))
+    else:
+        game = Game()
     game.run()
\ No newline at end of file
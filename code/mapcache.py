@@ -0,0 +1,206 @@
+import os
+import json
+import mmap
+import struct
+from hashlib import sha1
+from os.path import normpath
+from settings import *
+from grid import Grid
+
+# compiled maps live next to their TMX file, rebuilt when the TMX mtime and hash both change
+CACHE_SUFFIX = '.cache'
+MAGIC = b'SVMC'
+VERSION = 1
+
+# header: magic, version, tmx mtime, tmx sha1, width, height, tile size, json length,
+# object count, collision count, spawn count
+HEADER = struct.Struct('<4sHd20sHHHIIII')
+OBJECT = struct.Struct('<ddH')  # x, y, image index
+COLLISION = struct.Struct('<ddddB')  # x, y, width, height, kind
+POINT = struct.Struct('<dd')
+
+# collision kinds
+COLLISION_AREA = 0
+DANGER_AREA = 1
+HEALTH_AREA = 2
+
+def create_grid(blocked_rects, danger_rects, width, height):
+    # Initialize an empty grid of 0s (all cells are passable initially)
+    grid = bytearray(width * height)
+
+    # Mark collision rects as blocked (1) in the grid
+    for rect in blocked_rects:
+        # Calculate the top-left and bottom-right corners in grid coordinates
+        start_x = int(rect.left // TILE_SIZE)
+        start_y = int(rect.top // TILE_SIZE)
+        end_x = int(rect.right // TILE_SIZE)
+        end_y = int(rect.bottom // TILE_SIZE)
+
+        # Loop through each grid cell the rect covers
+        for x in range(start_x, end_x + 1):
+            for y in range(start_y, end_y + 1):
+                if 0 <= x < width and 0 <= y < height:
+                    grid[y * width + x] = 1  # Block the grid cell
+
+    # Mark danger area rects as danger (2) in the grid
+    for rect in danger_rects:
+        start_x = int(rect.left // TILE_SIZE)
+        start_y = int(rect.top // TILE_SIZE)
+        end_x = int(rect.right // TILE_SIZE)
+        end_y = int(rect.bottom // TILE_SIZE)
+
+        for x in range(start_x, end_x + 1):
+            for y in range(start_y, end_y + 1):
+                if 0 <= x < width and 0 <= y < height and grid[y * width + x] != 1:
+                    grid[y * width + x] = 2  # Mark as a danger zone
+    return grid
+
+def file_hash(path):
+    with open(path, 'rb') as file:
+        return sha1(file.read()).digest()
+
+def compile_map(tmx_path, cache_path=None):
+    # parsing the TMX is the slow path, pytmx is only needed here
+    from pytmx import TiledMap
+
+    cache_path = cache_path or tmx_path + CACHE_SUFFIX
+    tmx = TiledMap(tmx_path)  # default loader, images stay (file, rect, flags) references
+    width, height = tmx.width, tmx.height
+
+    images, image_index, sizes = [], {}, {}
+    def add_image(reference):
+        filename, rect, flags = reference
+        filename = normpath(filename)
+        flags = [int(flags.flipped_horizontally), int(flags.flipped_vertically), int(flags.flipped_diagonally)] if flags else [0, 0, 0]
+        key = (filename, tuple(rect) if rect else None, tuple(flags))
+        if key not in image_index:
+            image_index[key] = len(images)
+            images.append([filename, list(rect) if rect else None, flags])
+        return image_index[key]
+
+    def image_size(reference):
+        # object sprites are sized by their image, exactly like CollisionSprite
+        filename, rect, _ = reference
+        if rect:
+            return rect[2], rect[3]
+        if filename not in sizes:
+            sizes[filename] = pygame.image.load(filename).get_size()
+        return sizes[filename]
+
+    # ground, 0 means no tile
+    tiles = bytearray(width * height * 2)
+    for x, y, gid in tmx.get_layer_by_name('Ground').iter_data():
+        if gid:
+            struct.pack_into('<H', tiles, (y * width + x) * 2, add_image(tmx.images[gid]) + 1)
+
+    objects, blocked_rects, danger_rects = [], [], []
+    for obj in tmx.get_layer_by_name('Objects'):
+        reference = tmx.images[obj.gid]
+        objects.append(OBJECT.pack(obj.x, obj.y, add_image(reference)))
+        blocked_rects.append(pygame.FRect((obj.x, obj.y), image_size(reference)))
+
+    collisions = []
+    for obj in tmx.get_layer_by_name('Collisions'):
+        kind = {'dangarea': DANGER_AREA, 'healtharea': HEALTH_AREA}.get(obj.name, COLLISION_AREA)
+        collisions.append(COLLISION.pack(obj.x, obj.y, obj.width, obj.height, kind))
+        rect = pygame.FRect((obj.x, obj.y), (int(obj.width), int(obj.height)))
+        if kind == COLLISION_AREA:
+            blocked_rects.append(rect)
+        elif kind == DANGER_AREA:
+            danger_rects.append(rect)
+
+    player_pos, spawns = (0, 0), []
+    for obj in tmx.get_layer_by_name('Entities'):
+        if obj.name == 'Player':
+            player_pos = (obj.x, obj.y)
+        else:
+            spawns.append(POINT.pack(obj.x, obj.y))
+
+    grid = create_grid(blocked_rects, danger_rects, width, height)
+
+    # the json block is padded so the arrays after it stay aligned
+    meta = json.dumps({'images': images}).encode()
+    meta += b' ' * (-(HEADER.size + len(meta)) % 8)
+    header = HEADER.pack(MAGIC, VERSION, os.stat(tmx_path).st_mtime, file_hash(tmx_path),
+                         width, height, tmx.tilewidth, len(meta), len(objects), len(collisions), len(spawns))
+    temp_path = cache_path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(header + meta + tiles + grid + b''.join(objects) + b''.join(collisions)
+                   + POINT.pack(*player_pos) + b''.join(spawns))
+    os.replace(temp_path, cache_path)
+    return cache_path
+
+def read_header(cache_path):
+    try:
+        with open(cache_path, 'rb') as file:
+            header = HEADER.unpack(file.read(HEADER.size))
+    except (OSError, struct.error):
+        return None
+    if header[0] != MAGIC or header[1] != VERSION:
+        return None
+    return header
+
+def cache_is_fresh(tmx_path, cache_path):
+    header = read_header(cache_path)
+    if header is None:
+        return False
+    if header[2] == os.stat(tmx_path).st_mtime:
+        return True
+
+    # touched but maybe unchanged, fall back to the content hash and refresh the stored mtime
+    if header[3] != file_hash(tmx_path):
+        return False
+    with open(cache_path, 'r+b') as file:
+        file.write(HEADER.pack(*header[:2], os.stat(tmx_path).st_mtime, *header[3:]))
+    return True
+
+class MapData:
+    def __init__(self, cache_path):
+        with open(cache_path, 'rb') as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.buffer)
+        (_, _, _, _, self.width, self.height, self.tile_size,
+         meta_length, object_count, collision_count, spawn_count) = HEADER.unpack_from(self.buffer)
+        offset = HEADER.size
+        self.images = json.loads(bytes(view[offset:offset + meta_length]))['images']
+        offset += meta_length
+
+        cells = self.width * self.height
+        self.tiles = view[offset:offset + cells * 2].cast('H')
+        offset += cells * 2
+        self.grid = Grid(self.width, self.height, view[offset:offset + cells])  # a writable copy
+        offset += cells
+
+        self.objects = list(OBJECT.iter_unpack(view[offset:offset + object_count * OBJECT.size]))
+        offset += object_count * OBJECT.size
+        self.collisions = list(COLLISION.iter_unpack(view[offset:offset + collision_count * COLLISION.size]))
+        offset += collision_count * COLLISION.size
+        self.player_pos = POINT.unpack_from(self.buffer, offset)
+        offset += POINT.size
+        self.spawn_positions = list(POINT.iter_unpack(view[offset:offset + spawn_count * POINT.size]))
+
+    def load_images(self):
+        # every image file is decoded once, tiles are cut out of their tileset
+        files, surfaces = {}, []
+        for filename, rect, flags in self.images:
+            if filename not in files:
+                files[filename] = pygame.image.load(filename).convert_alpha()
+            surf = files[filename].subsurface(rect) if rect else files[filename]
+            if flags[2]:
+                surf = pygame.transform.flip(pygame.transform.rotate(surf, 270), True, False)
+            if flags[0] or flags[1]:
+                surf = pygame.transform.flip(surf, flags[0], flags[1])
+            surfaces.append(surf)
+        return surfaces
+
+def load_map(tmx_path):
+    cache_path = tmx_path + CACHE_SUFFIX
+    if not cache_is_fresh(tmx_path, cache_path):
+        compile_map(tmx_path, cache_path)
+    return MapData(cache_path)
+
+if __name__ == '__main__':
+    # build step: python code/mapcache.py [map.tmx ...], run from the repository root
+    import sys
+    for path in sys.argv[1:] or [os.path.join('data', 'maps', 'world.tmx')]:
+        print('compiled', compile_map(path))
@@ -0,0 +1,240 @@
+from collections import ChainMap, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import count
+from settings import *
+from profiler import profiler
+from grid import AIR, GROUND
+from hierarchy import ClusterGraph, HierarchicalField
+
+# 4 possible directions: up, down, left, right
+DIRECTIONS = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+
+field_versions = count(1)  # unique across every field, so a version names one set of paths
+
+def flow_search(walkable, width, height, bit, goal):
+    # breadth first search outwards from the goal, every edge costs 1
+    # a step u -> v is allowed when v is walkable, so only walkable cells keep expanding
+    # plain arguments only, so it can run in a worker process on a snapshot of the grid
+    next_cell = {goal: None}
+    gx, gy = goal
+    if not (0 <= gx < width and 0 <= gy < height) or not walkable[gy * width + gx] & bit:
+        return next_cell, 0  # nobody can step onto the goal
+
+    queue = deque([goal])
+    expanded = 0
+    while queue:
+        current = queue.popleft()
+        expanded += 1
+        cx, cy = current
+        for dx, dy in DIRECTIONS:
+            x, y = cx + dx, cy + dy
+            if 0 <= x < width and 0 <= y < height and (x, y) not in next_cell:
+                next_cell[(x, y)] = current
+                if walkable[y * width + x] & bit:
+                    queue.append((x, y))
+    return next_cell, expanded
+
+class FlowField:
+    def __init__(self, grid, inAir):
+        self.grid = grid
+        self.inAir = inAir  # in air can pass through danger areas
+        self.bit = AIR if inAir else GROUND
+        self.width, self.height = grid.width, grid.height
+        self.goal = None
+        self.next_cell = {}  # cell -> next cell towards the goal
+        self.version = 0  # changes on every build
+        self.grid_version = -1  # grid version the field was built against
+
+    def walkable(self, x, y):
+        return self.grid.walkable[y * self.width + x] & self.bit
+
+    def build(self, goal):
+        with profiler.section('pathfinding'):
+            next_cell, expanded = flow_search(self.grid.walkable, self.width, self.height, self.bit, goal)
+        self.finish(goal, next_cell, self.grid.version, expanded)
+
+    def finish(self, goal, next_cell, grid_version, expanded):
+        # takes a search result, from build or from the worker
+        self.goal = goal
+        self.next_cell = next_cell
+        self.version = next(field_versions)
+        self.grid_version = grid_version
+        if profiler.enabled:
+            profiler.count('searches')
+            profiler.count('nodes expanded', expanded)
+
+    def path(self, start):
+        # [start, next step] like the head of an A* path, [goal] when the goal can't be reached
+        if start == self.goal:
+            return [start]
+        step = self.next_cell.get(start)
+        if step is None:
+            return [self.goal]
+        return [start, step]
+
+    def step(self, cell):
+        return self.next_cell.get(cell)
+
+class Pathfinder:
+    # serves one flow field per movement class towards the current goal
+    # built fields are kept in an LRU keyed by (goal, inAir, grid version), and at most
+    # PATH_SEARCHES_PER_TICK searches start per tick, the rest wait in a queue
+    # with a worker ('thread' or 'process') searches run off the main loop on a snapshot of the grid
+    # and the results are picked up by a later update, the old field stands in meanwhile; a class has
+    # one search in flight at most, and the next one starts for wherever the target is by then
+    # maps of PATH_HIERARCHY_CELLS cells or more search a cluster graph instead (see hierarchy.py)
+    def __init__(self, grid, worker=PATH_WORKER):
+        self.grid = grid
+        self.hierarchical = grid.width * grid.height >= PATH_HIERARCHY_CELLS
+        self.graphs = {}  # inAir -> ClusterGraph
+        self.fields = {False: None, True: None}
+        self.goal = None
+        self.cache = OrderedDict()
+        self.queue = deque()  # movement classes waiting for a search
+        self.pending = {}  # inAir -> (key, future), one search on the worker per movement class
+        self.executor = None
+        if worker == 'thread':
+            self.executor = ThreadPoolExecutor(1)
+        elif worker == 'process':
+            self.executor = ProcessPoolExecutor(1)
+
+    def update(self, target_pos):
+        # the goal is the cell of the target
+        self.goal = (int(target_pos[0] // TILE_SIZE), int(target_pos[1] // TILE_SIZE))
+        self.take_changes()
+
+        # searches only run here, in a fixed order, so what enemies see doesn't depend on who asks first
+        budget = PATH_SEARCHES_PER_TICK
+        for inAir in (False, True):
+            if self.stale(inAir) and inAir not in self.queue:
+                self.queue.append(inAir)
+        for inAir in list(self.queue):
+            key = (self.goal, inAir, self.grid.version)
+            field = self.cached(key)
+            if field is not None:
+                if profiler.enabled:
+                    profiler.count('path cache hits')
+            elif self.executor and not self.hierarchical:
+                field = self.collect(inAir)
+                if field is None or not self.current(field.goal, field.grid_version):
+                    if field is not None:
+                        self.fields[inAir] = field  # the target moved on, still newer than what enemies have
+                    if inAir not in self.pending and budget > 0:
+                        self.submit(key)
+                        budget -= 1
+                    self.fields[inAir] = self.stand_in(self.fields[inAir], self.goal)
+                    continue
+            elif budget > 0:
+                field = self.search(key)
+                budget -= 1
+            else:
+                if profiler.enabled:
+                    profiler.count('searches deferred')
+                self.fields[inAir] = self.stand_in(self.fields[inAir], self.goal)
+                continue
+            self.fields[inAir] = field
+            self.queue.remove(inAir)
+
+    def stale(self, inAir):
+        field = self.fields[inAir]
+        return field is not None and not self.current(field.goal, field.grid_version)
+
+    def cached(self, key):
+        field = self.cache.get(key)
+        if field is not None:
+            self.cache.move_to_end(key)
+        return field
+
+    def search(self, key):
+        goal, inAir, _ = key
+        if self.hierarchical:
+            field = HierarchicalField(self.graph(inAir), field_versions)
+        else:
+            field = FlowField(self.grid, inAir)
+        field.build(goal)
+        self.remember(key, field)
+        return field
+
+    def graph(self, inAir):
+        # built once per movement class, after that only the changed clusters are redone
+        self.take_changes()
+        graph = self.graphs.get(inAir)
+        if graph is None:
+            graph = self.graphs[inAir] = ClusterGraph(self.grid, inAir)
+        else:
+            graph.update()
+        return graph
+
+    def take_changes(self):
+        # changed grid regions go to the cluster graphs, a flat search has no use for them
+        dirty = self.grid.take_dirty()
+        for graph in self.graphs.values():
+            graph.dirty += dirty
+
+    def submit(self, key):
+        goal, inAir, grid_version = key
+        bit = AIR if inAir else GROUND
+        snapshot = bytes(self.grid.walkable)  # the worker never sees later changes
+        self.pending[inAir] = key, self.executor.submit(flow_search, snapshot, self.grid.width, self.grid.height, bit, goal)
+
+    def current(self, goal, grid_version):
+        return goal == self.goal and grid_version == self.grid.version
+
+    def collect(self, inAir):
+        # never waits, a search that isn't done yet is looked at again next tick
+        # one for an old goal is cancelled if it hasn't started, a running one is let finish
+        if inAir not in self.pending:
+            return None
+        key, future = self.pending[inAir]
+        if not future.done():
+            if not self.current(key[0], key[2]) and future.cancel():
+                del self.pending[inAir]
+            return None
+        del self.pending[inAir]
+        goal, inAir, grid_version = key
+        field = FlowField(self.grid, inAir)
+        next_cell, expanded = future.result()
+        field.finish(goal, next_cell, grid_version, expanded)
+        self.remember(key, field)
+        return field
+
+    def remember(self, key, field):
+        self.cache[key] = field
+        if len(self.cache) > PATH_CACHE_SIZE:
+            self.cache.popitem(last=False)
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+            self.pending.clear()
+
+    def stand_in(self, field, goal):
+        # while a search waits, splice the old field onto a neighbouring goal or keep it as it is
+        if field.goal == goal:
+            return field
+        gx, gy = goal
+        ox, oy = field.goal
+        if abs(gx - ox) + abs(gy - oy) == 1 and self.grid.inside(gx, gy) and field.walkable(gx, gy):
+            # the old field extended by one step onto the new goal
+            spliced = FlowField(self.grid, field.inAir)
+            spliced.goal = goal
+            spliced.next_cell = ChainMap({field.goal: goal, goal: None}, field.next_cell)
+            spliced.version = next(field_versions)
+            spliced.grid_version = field.grid_version
+            return spliced
+        return field
+
+    def field(self, inAir):
+        # the first field of a movement class is built when its first enemy asks,
+        # so a class with no enemies costs nothing; update keeps it current after that
+        if self.fields[inAir] is None:
+            key = (self.goal, inAir, self.grid.version)
+            self.fields[inAir] = self.cached(key) or self.search(key)
+        return self.fields[inAir]
+
+    def path(self, start, inAir):
+        return self.field(inAir).path(start)
+
+    def step(self, cell, inAir):
+        return self.field(inAir).step(cell)
@@ -1,49 +1,51 @@
 from settings import *
+from profiler import profiler
+from assets import assets
 
 class Player(pygame.sprite.Sprite):
-    def __init__(self, pos, groups,collision_sprites):
+    def __init__(self, pos, groups,collision_hash,controls):
         super().__init__(groups)
         self.load_images()
         self.state, self.frame_index = 'down',0
-        self.image = pygame.image.load(join('images','player','down','0.png')).convert_alpha()
+        self.image = self.frames[self.state][0]
+        self.mask = self.masks[self.state][0]
         self.rect = self.image.get_frect(center = pos)
         self.hitbox_rect = self.rect.inflate(-60,-90)
         
         # movement 
         self.direction = pygame.Vector2()
         self.speed = 400
-        self.collision_sprites = collision_sprites
+        self.collision_hash = collision_hash
+        self.controls = controls
         
         # Health Points (HP)
         self.max_hp = PLAYER_INITIAL_HP
         self.current_hp = self.max_hp
     
     def load_images(self):
-        self.frames = {'left':[], 'right':[], 'up':[], 'down':[]}
-        
-        for state in self.frames.keys():
-            for folder_path, sub_folder, file_names in walk(join('images','player',state)):
-                if file_names:
-                    for file_name in sorted(file_names, key= lambda name: int(name.split('.')[0])):
-                        full_path = join(folder_path,file_name)
-                        surf = pygame.image.load(full_path).convert_alpha()
-                        self.frames[state].append(surf)
+        # frames and masks are shared through the asset manager
+        self.frames = {state: assets.frames('player/' + state) for state in ('left', 'right', 'up', 'down')}
+        self.masks = {state: assets.frame_masks('player/' + state) for state in self.frames}
         
     def input(self):
-        key = pygame.key.get_pressed()
+        key = self.controls.keys()
         self.direction.x = int(key[pygame.K_RIGHT] or key[pygame.K_d]) - int(key[pygame.K_LEFT] or key[pygame.K_a])
         self.direction.y = int(key[pygame.K_DOWN] or key[pygame.K_s]) - int(key[pygame.K_UP] or key[pygame.K_w])
         self.direction = self.direction.normalize() if self.direction else self.direction
     
     def move(self,dt):
-        self.hitbox_rect.x += self.direction.x * self.speed * dt
-        self.collision('horizantal')
-        self.hitbox_rect.y += self.direction.y * self.speed * dt
-        self.collision('vertical')
+        with profiler.section('collision'):
+            previous = self.hitbox_rect.copy()
+            self.hitbox_rect.x += self.direction.x * self.speed * dt
+            self.collision('horizantal', previous)
+            previous = self.hitbox_rect.copy()
+            self.hitbox_rect.y += self.direction.y * self.speed * dt
+            self.collision('vertical', previous)
         self.rect.center = self.hitbox_rect.center
     
-    def collision(self,direction):
-        for sprite in self.collision_sprites:
+    def collision(self,direction,previous):
+        # only the obstacles around the swept hitbox can push it out
+        for sprite in self.collision_hash.query(self.hitbox_rect.union(previous)):
             if sprite.rect.colliderect(self.hitbox_rect):
                 if direction == 'horizantal':
                     if self.direction.x > 0 : self.hitbox_rect.right = sprite.rect.left
@@ -61,7 +63,9 @@ class Player(pygame.sprite.Sprite):
         
         # animate
         self.frame_index = self.frame_index + 5 * dt if self.direction else 0
-        self.image = self.frames[self.state][int(self.frame_index) % len(self.frames[self.state])]
+        index = int(self.frame_index) % len(self.frames[self.state])
+        self.image = self.frames[self.state][index]
+        self.mask = self.masks[self.state][index]
     
     def take_damage(self, amount):
         """Reduce HP by the specified amount and check for death."""
@@ -0,0 +1,18 @@
+class Pool:
+    # recycles killed sprites instead of allocating new ones
+    # pooled classes take the same arguments in __init__ and reset, and call release from kill
+    def __init__(self, cls):
+        self.cls = cls
+        self.dormant = []
+
+    def get(self, *args, **kwargs):
+        if self.dormant:
+            sprite = self.dormant.pop()
+            sprite.reset(*args, **kwargs)
+        else:
+            sprite = self.cls(*args, **kwargs)
+            sprite.pool = self
+        return sprite
+
+    def release(self, sprite):
+        self.dormant.append(sprite)
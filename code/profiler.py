@@ -0,0 +1,127 @@
+import os
+import json
+from collections import deque
+from time import perf_counter
+from settings import *
+
+# stages of Game.run, drawn as stacked bars in this order
+STAGES = {
+    'events': (120, 120, 255),
+    'update': (80, 200, 80),
+    'bullet_collision': (255, 200, 0),
+    'player_collision': (255, 120, 0),
+    'draw': (200, 80, 200),
+}
+HISTORY = 240  # frames kept for the graph
+GRAPH_HEIGHT = 80
+GRAPH_SCALE = 2  # pixels per millisecond
+
+class Section:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = perf_counter()
+
+    def __exit__(self, *_):
+        self.profiler.add_time(self.name, perf_counter() - self.start)
+
+class NullSection:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *_):
+        pass
+
+NULL_SECTION = NullSection()
+
+class Profiler:
+    # opt-in, toggled with F3 or by setting SURVIVOR_PROFILE=1
+    # SURVIVOR_PROFILE_TRACE=<file> also appends one JSON line per frame to that file
+    def __init__(self):
+        self.enabled = os.environ.get('SURVIVOR_PROFILE', '') not in ('', '0')
+        self.trace_path = os.environ.get('SURVIVOR_PROFILE_TRACE')
+        self.trace_file = None
+        self.frame = 0
+        self.timings = {}
+        self.counters = {}
+        self.history = deque(maxlen=HISTORY)
+        self.sections = {}
+        self.font = None
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.timings.clear()
+        self.counters.clear()
+
+    def section(self, name):
+        # when disabled this is a shared no-op, so the hooks can stay in place
+        if not self.enabled:
+            return NULL_SECTION
+        if name not in self.sections:
+            self.sections[name] = Section(self, name)
+        return self.sections[name]
+
+    def add_time(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0) + seconds
+
+    def count(self, name, amount=1):
+        # hot callers check profiler.enabled first
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name, value):
+        # a level rather than a per-frame total, like a pool size
+        self.counters[name] = value
+
+    def end_frame(self):
+        self.frame += 1
+        if not self.enabled:
+            return
+        record = {
+            'frame': self.frame,
+            'timings': {name: seconds * 1000 for name, seconds in self.timings.items()},
+            'counters': dict(self.counters),
+        }
+        self.history.append(record)
+        if self.trace_path:
+            if self.trace_file is None:
+                self.trace_file = open(self.trace_path, 'a')
+            self.trace_file.write(json.dumps(record) + '\n')
+        self.timings.clear()
+        self.counters.clear()
+
+    def draw(self, surface):
+        if not self.enabled or not self.history:
+            return
+        if self.font is None:
+            self.font = pygame.font.Font(None, 20)
+
+        # stacked frame time bars, newest on the right
+        background = pygame.Rect(10, 10, HISTORY, GRAPH_HEIGHT)
+        surface.fill((20, 20, 20), background)
+        for x, record in enumerate(self.history, start=background.left + HISTORY - len(self.history)):
+            bottom = background.bottom
+            for stage, color in STAGES.items():
+                height = record['timings'].get(stage, 0) * GRAPH_SCALE
+                if height:
+                    top = max(background.top, bottom - height)
+                    pygame.draw.line(surface, color, (x, bottom), (x, top))
+                    bottom = top
+        budget = background.bottom - 1000 / 60 * GRAPH_SCALE  # 60 fps line
+        pygame.draw.line(surface, 'white', (background.left, budget), (background.right, budget))
+
+        # numbers of the last frame
+        last = self.history[-1]
+        lines = ['%s %.2f ms' % (name, ms) for name, ms in last['timings'].items()]
+        lines += ['%s %d' % (name, value) for name, value in last['counters'].items()]
+        for i, line in enumerate(lines):
+            surface.blit(self.font.render(line, True, 'white'), (background.left, background.bottom + 5 + i * 16))
+
+    def close(self):
+        if self.trace_file:
+            self.trace_file.close()
+            self.trace_file = None
+
+profiler = Profiler()
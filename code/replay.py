@@ -0,0 +1,167 @@
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')  # keep stdout valid JSON
+
+import json
+import random
+import struct
+from argparse import ArgumentParser
+from time import perf_counter
+
+from settings import *
+from controls import Controls, KeyState
+from timing import game_time
+
+# a session log is a header followed by one record per simulation tick
+# header: magic, version, tick rate, random seed
+# tick: pressed keys (bits of RECORDED_KEYS), mouse x, mouse y, mouse buttons (bits),
+# enemies spawned this tick, live enemies, player x, player y; the last four are checks for the replay
+MAGIC = b'SVRP'
+VERSION = 1
+HEADER = struct.Struct('<4sHHQ')
+TICK = struct.Struct('<HhhBBHff')
+RECORDED_KEYS = (pygame.K_RIGHT, pygame.K_d, pygame.K_LEFT, pygame.K_a, pygame.K_DOWN, pygame.K_s, pygame.K_UP, pygame.K_w)
+
+def key_bits(keys):
+    return sum(1 << bit for bit, key in enumerate(RECORDED_KEYS) if keys[key])
+
+def tick_checks(game, spawned):
+    return spawned, len(game.enemy_sprites), game.player.rect.x, game.player.rect.y
+
+class Recorder(Controls):
+    # live input, latched once per tick and written to a session log with the random seed
+    deterministic = True
+
+    def __init__(self, path, seed=None):
+        self.seed = random.randrange(1 << 63) if seed is None else seed
+        random.seed(self.seed)
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, TICK_RATE, self.seed))
+        self.spawned = 0
+        self.state = (0, (0, 0), (False, False, False))  # pygame isn't up yet, Game.step latches every tick
+
+    def latch(self):
+        live = pygame.key.get_pressed()
+        self.state = (key_bits(live), pygame.mouse.get_pos(), pygame.mouse.get_pressed())
+
+    def end_tick(self, game):
+        bits, (x, y), buttons = self.state
+        spawned = game.director.spawned - self.spawned
+        self.spawned = game.director.spawned
+        button_bits = sum(1 << bit for bit, pressed in enumerate(buttons) if pressed)
+        self.file.write(TICK.pack(bits, x, y, button_bits, *tick_checks(game, spawned)))
+
+    def keys(self):
+        return KeyState(key for bit, key in enumerate(RECORDED_KEYS) if self.state[0] & 1 << bit)
+
+    def mouse_pos(self):
+        return self.state[1]
+
+    def mouse_pressed(self):
+        return self.state[2]
+
+    def close(self):
+        self.file.close()
+
+def read_session(path):
+    with open(path, 'rb') as file:
+        data = file.read()
+    magic, version, tick_rate, seed = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('%s is not a session log of this version' % path)
+    body = memoryview(data)[HEADER.size:]
+    body = body[:len(body) - len(body) % TICK.size]  # a session cut short keeps its whole ticks
+    return tick_rate, seed, list(TICK.iter_unpack(body))
+
+class ReplayControls(Controls):
+    # feeds the ticks of a session log back and checks the game against what was recorded
+    deterministic = True
+
+    def __init__(self, ticks):
+        self.ticks = ticks
+        self.tick = -1
+        self.spawned = 0
+        self.divergence = None  # first tick whose checks didn't match
+        self.load(0)
+
+    def latch(self):
+        self.tick = min(self.tick + 1, len(self.ticks) - 1)
+        self.load(self.tick)
+
+    def load(self, tick):
+        bits, x, y, buttons, *_ = self.ticks[tick]
+        self.state = (bits, (x, y), tuple(bool(buttons & 1 << bit) for bit in range(3)))
+
+    def end_tick(self, game):
+        spawned = game.director.spawned - self.spawned
+        self.spawned = game.director.spawned
+        expected = self.ticks[self.tick][4:]
+        actual = struct.unpack('<BHff', struct.pack('<BHff', *tick_checks(game, spawned)))  # same rounding as the log
+        if self.divergence is None and actual != expected:
+            self.divergence = {'tick': self.tick, 'expected': expected, 'actual': actual}
+
+    keys = Recorder.keys
+    mouse_pos = Recorder.mouse_pos
+    mouse_pressed = Recorder.mouse_pressed
+
+def replay(path, backend=ENEMY_BACKEND):
+    # plays a session log headless and as fast as possible, timing every tick
+    from main import Game
+    from benchmark import percentiles
+
+    tick_rate, seed, ticks = read_session(path)
+    random.seed(seed)
+    controls = ReplayControls(ticks)
+    game = Game(controls, backend, headless=True)
+    dt = 1 / tick_rate
+    tick_ms = []
+    for _ in ticks:
+        if not game.runnig:
+            break
+        start = perf_counter()
+        game.step(dt)
+        tick_ms.append((perf_counter() - start) * 1000)
+    game.close()
+    return {
+        'session': path,
+        'backend': backend,
+        'ticks': len(tick_ms),
+        'recorded_ticks': len(ticks),
+        'game_time': game_time.get_ticks() / 1000,
+        'divergence': controls.divergence,
+        'unit': 'ms',
+        'tick': percentiles(tick_ms),
+        'tick_ms': tick_ms,
+    }
+
+def compare(report, baseline):
+    # per-tick change against an earlier replay of the same session
+    from benchmark import percentiles
+    ratios = [after / before for after, before in zip(report['tick_ms'], baseline['tick_ms']) if before > 0]
+    return {
+        'mean_before': baseline['tick']['mean'],
+        'mean_after': report['tick']['mean'],
+        'p99_before': baseline['tick']['p99'],
+        'p99_after': report['tick']['p99'],
+        'tick_ratio': percentiles(ratios) if ratios else None,
+    }
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='replay a recorded session headless, run from the repository root')
+    parser.add_argument('session', help='log written by python code/main.py --record FILE')
+    parser.add_argument('--backend', choices=('sprites', 'numpy'), default=ENEMY_BACKEND)
+    parser.add_argument('--baseline', help='JSON report of an earlier replay to compare against, tick by tick')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    report = replay(args.session, args.backend)
+    if args.baseline:
+        with open(args.baseline) as file:
+            report['comparison'] = compare(report, json.load(file))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text)
+    else:
+        print(text)
@@ -12,4 +12,50 @@ PLAYER_INITIAL_HP = 100
 # GRID_HEIGHT = WINDOW_HEIGHT // TILE_SIZE  # 480 // 32 = 15 rows
 
 GRID_WIDTH = 64
-GRID_HEIGHT = 50
\ No newline at end of file
+GRID_HEIGHT = 50
+
+CHUNK_SIZE = 8  # tiles per side of a pre-rendered ground chunk
+STREAM_RADIUS = 3  # chunks around the player kept loaded, enough to cover the window
+CHUNK_BUDGET = 96  # loaded chunks kept before the least recently needed are evicted
+
+# loop timing
+TICK_RATE = 60  # fixed simulation steps per second
+FPS_CAP = 144  # rendered frames per second, 0 = uncapped
+VSYNC = False  # sync the flip to the display instead of the frame cap
+DIRTY_RECTS = False  # while the camera stands still only push the areas that changed
+DIRTY_RECT_LIMIT = 64  # more changed areas than this and the whole screen is redrawn
+MAX_FRAME_TIME = 0.25  # seconds of simulation caught up at most per rendered frame
+
+# enemy level of detail, (distance in px, tick every n ticks) from near to far
+ENEMY_LOD = True
+LOD_BANDS = ((900, 1), (1800, 2))
+LOD_FAR_INTERVAL = 4  # beyond the last band
+
+# crowd separation between sprite enemies
+ENEMY_SEPARATION = True
+SEPARATION_RADIUS = 48  # px between centers where enemies start pushing apart
+SEPARATION_WEIGHT = 1.5  # strength of the push against the path direction
+
+# spawning, times in ms of game time
+SPAWN_INTERVAL = 5000  # between spawns at the start
+SPAWN_INTERVAL_MIN = 1000  # between spawns once the ramp is done
+SPAWN_RAMP_TIME = 180000  # to go from SPAWN_INTERVAL to SPAWN_INTERVAL_MIN
+MAX_ENEMIES = 200  # live enemies, spawns are skipped above this
+ENEMY_WEIGHTS = {'blob': 1, 'skeleton': 1, 'bat': 2}  # relative odds, unknown types count 1
+
+# pathfinding
+PATH_SEARCHES_PER_TICK = 1  # flow field searches per tick, more wait for the next tick
+PATH_CACHE_SIZE = 16  # built flow fields kept for reuse
+PATH_HIERARCHY_CELLS = 128 * 128  # maps this big or bigger search a cluster graph (HPA*)
+CLUSTER_SIZE = 16  # cells per side of a cluster
+PATH_WORKER = None  # None searches on the main loop, 'thread' or 'process' searches in the background
+
+# sound effects, mixer channels set aside per category and voices of one sound playing at once
+SOUND_CHANNELS = {'weapons': 4, 'impacts': 6}
+SOUND_VOICES = 2
+
+# rotating sprites snap to this many degrees so their rotated images can be cached
+ROTATION_STEP = 2
+
+# 'sprites' for one Enemy sprite each, 'numpy' for the vectorized horde (needs numpy)
+ENEMY_BACKEND = 'sprites'
@@ -0,0 +1,83 @@
+from settings import *
+from profiler import profiler
+
+class SpatialHash:
+    def __init__(self, sprites=(), cell_size=TILE_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}  # (cell x, cell y) -> sprites whose rect touches the cell
+        self.order = {}  # sprite -> insertion index, keeps query results in group order
+        for sprite in sprites:
+            self.insert(sprite)
+
+    def cell_range(self, rect):
+        left, top = int(rect.left // self.cell_size), int(rect.top // self.cell_size)
+        right, bottom = int(rect.right // self.cell_size), int(rect.bottom // self.cell_size)
+        return [(x, y) for x in range(left, right + 1) for y in range(top, bottom + 1)]
+
+    def clear(self):
+        self.cells.clear()
+        self.order.clear()
+
+    def rebuild(self, sprites):
+        # dynamic sprites are re-bucketed once per tick
+        self.clear()
+        for sprite in sprites:
+            self.insert(sprite)
+
+    def insert(self, sprite, order=None):
+        # order sets where the sprite sorts in query results, by default after everything else
+        self.order[sprite] = len(self.order) if order is None else order
+        for cell in self.cell_range(sprite.rect):
+            self.cells.setdefault(cell, []).append(sprite)
+
+    def remove(self, sprite):
+        del self.order[sprite]
+        for cell in self.cell_range(sprite.rect):
+            self.cells[cell].remove(sprite)
+            if not self.cells[cell]:
+                del self.cells[cell]
+
+    def query(self, rect):
+        # candidates only, callers still run their own rect test
+        found = set()
+        for cell in self.cell_range(rect):
+            found.update(self.cells.get(cell, ()))
+        return sorted(found, key=self.order.__getitem__)
+
+    def __iter__(self):
+        return iter(self.order)
+
+    def __len__(self):
+        return len(self.order)
+
+class NeighbourGrid:
+    # sprite centres bucketed by a cell the size of the search radius, so a neighbour search
+    # only reads the 3 x 3 cells around a point; rebuilt once per tick
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}  # (cell x, cell y) -> [(x, y, sprite)]
+
+    def rebuild(self, sprites):
+        self.cells = cells = {}
+        size = self.cell_size
+        for sprite in sprites:
+            x, y = sprite.rect.center
+            cells.setdefault((int(x // size), int(y // size)), []).append((x, y, sprite))
+
+    def near(self, x, y):
+        cx, cy = int(x // self.cell_size), int(y // self.cell_size)
+        for cell_y in (cy - 1, cy, cy + 1):
+            for cell_x in (cx - 1, cx, cx + 1):
+                yield from self.cells.get((cell_x, cell_y), ())
+
+def spritecollide(sprite, spatial_hash, dokill=False):
+    # same result as pygame.sprite.spritecollide with collide_mask, but the pixel test
+    # only runs on the hashed candidates whose rect overlaps the sprite
+    candidates = [other for other in spatial_hash.query(sprite.rect) if sprite.rect.colliderect(other.rect)]
+    if profiler.enabled:
+        profiler.count('mask tests', len(candidates))
+    hits = [other for other in candidates if pygame.sprite.collide_mask(sprite, other)]
+    if dokill:
+        for other in hits:
+            other.kill()
+    return hits
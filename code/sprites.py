@@ -1,7 +1,26 @@
 from settings import *
+from timing import game_time
+from assets import assets
 from math import atan2,degrees
 import heapq
 
+class RotationCache:
+    # rotozoom results of one surface, the angle is quantized to ROTATION_STEP degrees
+    def __init__(self, surf, step=ROTATION_STEP):
+        self.surf = surf
+        self.step = step
+        self.images = {}
+
+    def key(self, angle, flip=False):
+        return round(angle / self.step) % round(360 / self.step), flip
+
+    def get(self, key):
+        if key not in self.images:
+            steps, flip = key
+            image = pygame.transform.rotozoom(self.surf, steps * self.step, 1)
+            self.images[key] = pygame.transform.flip(image, False, True) if flip else image
+        return self.images[key]
+
 class Sprite(pygame.sprite.Sprite):
     def __init__(self, pos, serf, groups):
         super().__init__(groups)
@@ -30,6 +49,8 @@ class HPBar(pygame.sprite.Sprite):
         # Create a surface for the health bar
         self.image = pygame.Surface((self.bar_width, self.bar_height))
         self.rect = self.image.get_rect()
+        self.bars = {}  # health width -> composed bar, only drawn the first time a width shows up
+        self.health_width = None
     
     def update(self, _):
         # Update position below the player
@@ -38,16 +59,23 @@ class HPBar(pygame.sprite.Sprite):
         
         # Calculate health ratio
         health_ratio = self.player.current_hp / self.player.max_hp
-        
-        # Clear the health bar surface
-        self.image.fill(self.background_color)  # Fill with background color
-        
-        # Draw the health portion
         health_width = int(self.bar_width * health_ratio)
-        pygame.draw.rect(self.image, self.health_color, (0, 0, health_width, self.bar_height))
-        
-        # Draw border
-        pygame.draw.rect(self.image, self.border_color, (0, 0, self.bar_width, self.bar_height), 2)
+        if health_width == self.health_width:
+            return
+        self.health_width = health_width
+        if health_width not in self.bars:
+            bar = pygame.Surface((self.bar_width, self.bar_height))
+            
+            # Clear the health bar surface
+            bar.fill(self.background_color)  # Fill with background color
+            
+            # Draw the health portion
+            pygame.draw.rect(bar, self.health_color, (0, 0, health_width, self.bar_height))
+            
+            # Draw border
+            pygame.draw.rect(bar, self.border_color, (0, 0, self.bar_width, self.bar_height), 2)
+            self.bars[health_width] = bar
+        self.image = self.bars[health_width]
           
 class Gun(pygame.sprite.Sprite):
     def __init__(self,player,groups):
@@ -58,22 +86,27 @@ class Gun(pygame.sprite.Sprite):
         
         # sprite setup
         super().__init__(groups)
-        self.gun_surf = pygame.image.load(join('images','gun','gun.png')).convert_alpha()
+        self.gun_surf = assets.image('gun/gun')
         self.image = self.gun_surf
         self.rect = self.image.get_frect(center = self.player.rect.center + self.player_direction * self.distance)
+        self.rotations = RotationCache(self.gun_surf)
+        self.rotation = None
         
     def get_directoin(self):
-        mouse_pos = pygame.Vector2(pygame.mouse.get_pos())
+        mouse_pos = pygame.Vector2(self.player.controls.mouse_pos())
         player_pos = pygame.Vector2(WINDOW_WIDTH / 2, WINDOW_HEIGHT / 2)
         self.player_direction = (mouse_pos - player_pos).normalize()
         
     def rotate_gun(self):
         angle = degrees(atan2(self.player_direction.x, self.player_direction.y)) - 90
         if self.player_direction.x > 0:
-            self.image = pygame.transform.rotozoom(self.gun_surf, angle, 1)
+            rotation = self.rotations.key(angle)
         else:
-            self.image = pygame.transform.rotozoom(self.gun_surf, abs(angle), 1)
-            self.image = pygame.transform.flip(self.image,False,True)
+            rotation = self.rotations.key(abs(angle), True)
+        # only swap the image when the snapped angle changes
+        if rotation != self.rotation:
+            self.rotation = rotation
+            self.image = self.rotations.get(rotation)
         
     def update(self , _):
         self.get_directoin()
@@ -81,11 +114,19 @@ class Gun(pygame.sprite.Sprite):
         self.rect.center = self.player.rect.center + self.player_direction * self.distance
         
 class Bullet(pygame.sprite.Sprite):
-    def __init__(self,surf,pos,direction,groups):
-        super().__init__(groups)
+    def __init__(self,surf,pos,direction,groups,mask=None):
+        super().__init__()
+        self.pool = None  # set when the bullet comes from a Pool
+        self.rect = surf.get_frect(center = pos)
+        self.reset(surf,pos,direction,groups,mask)
+        
+    def reset(self,surf,pos,direction,groups,mask=None):
+        self.add(groups)
         self.image = surf
-        self.rect = self.image.get_frect(center = pos)      
-        self.spawm_time = pygame.time.get_ticks()
+        self.mask = mask or pygame.mask.from_surface(surf)
+        self.rect.size = self.image.get_size()
+        self.rect.center = pos
+        self.spawm_time = game_time.get_ticks()
         self.lifetime = 1000
         
         self.direction = direction
@@ -94,8 +135,13 @@ class Bullet(pygame.sprite.Sprite):
     def update(self,dt):
         self.rect.center += self.direction * self.speed * dt    
         
-        if pygame.time.get_ticks() - self.spawm_time >= self.lifetime:
+        if game_time.get_ticks() - self.spawm_time >= self.lifetime:
             self.kill()
+            
+    def kill(self):
+        if self.pool is not None and self.alive():
+            self.pool.release(self)
+        super().kill()
     
 class Enemydsa(pygame.sprite.Sprite):
     def __init__(self, pos, frames, groups, player, collision_sprites):
@@ -147,7 +193,7 @@ class Enemydsa(pygame.sprite.Sprite):
     
     def destroy(self):
         # start timer
-        self.death_time = pygame.time.get_ticks()
+        self.death_time = game_time.get_ticks()
         
         # change image
         surf = pygame.mask.from_surface(self.frames[0]).to_surface()
@@ -155,7 +201,7 @@ class Enemydsa(pygame.sprite.Sprite):
         self.image = surf
         
     def death_timer(self):
-        if pygame.time.get_ticks() - self.death_time >= self.death_duration:
+        if game_time.get_ticks() - self.death_time >= self.death_duration:
             self.kill()
                 
     def update(self,dt):
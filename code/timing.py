@@ -0,0 +1,16 @@
+class GameTime:
+    # simulation time in milliseconds, advanced by the game loop instead of read from the wall clock
+    # so timers (gun cooldown, bullet lifetime, death flash) follow dt and runs can be reproduced
+    def __init__(self):
+        self.time = 0.0
+
+    def reset(self):
+        self.time = 0.0
+
+    def advance(self, dt):
+        self.time += dt * 1000
+
+    def get_ticks(self):
+        return int(self.time)
+
+game_time = GameTime()
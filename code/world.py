@@ -0,0 +1,153 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from settings import *
+from profiler import profiler
+from sprites import CollisionSprite
+from mapcache import COLLISION_AREA
+
+class World:
+    # streams the map in chunks around the player: the ground is baked to one surface per chunk
+    # on a worker thread, and obstacles become sprites and hash entries only while a chunk they
+    # overlap is within STREAM_RADIUS; chunks past CHUNK_BUDGET are evicted, oldest first
+    def __init__(self, map, images, groups, layers):
+        self.map = map
+        self.images = images
+        self.groups = groups  # Groups, draws the ground and the static sprites
+        self.layers = layers  # collision kind -> (sprite group, spatial hash)
+        self.chunk_pixels = CHUNK_SIZE * TILE_SIZE
+        self.columns = -(-map.width // CHUNK_SIZE)
+        self.rows = -(-map.height // CHUNK_SIZE)
+        self.display_surface = pygame.display.get_surface()
+
+        # (order, kind, pos, size, image) for every object and collision area, order is the
+        # position they had in their groups when everything was loaded up front, image is None for areas
+        self.records = [(order, COLLISION_AREA, (x, y), images[image].get_size(), image)
+                        for order, (x, y, image) in enumerate(map.objects)]
+        self.records += [(len(self.records) + order, kind, (x, y), (int(width), int(height)), None)
+                         for order, (x, y, width, height, kind) in enumerate(map.collisions)]
+        self.chunk_records = {}  # chunk -> indices of the records overlapping it
+        for index, (_, _, pos, size, _) in enumerate(self.records):
+            for chunk in self.groups.chunk_range(pygame.FRect(pos, size)):
+                self.chunk_records.setdefault(chunk, []).append(index)
+        self.sprites = {}  # record index -> sprite while loaded
+        self.references = {}  # record index -> loaded chunks overlapping it
+
+        self.loaded = OrderedDict()  # chunks with their sprites in place, least recently needed first
+        self.ground = OrderedDict()  # chunk -> baked surface, None for a chunk without tiles
+        self.baking = {}  # chunk -> future of the worker
+        self.tiles = {}  # image index -> private copy for the worker, it never shares a surface with the main thread
+        self.executor = ThreadPoolExecutor(1)
+
+    def chunk_of(self, pos):
+        return int(pos[0] // self.chunk_pixels), int(pos[1] // self.chunk_pixels)
+
+    def around(self, pos):
+        cx, cy = self.chunk_of(pos)
+        return [(x, y) for y in range(max(cy - STREAM_RADIUS, 0), min(cy + STREAM_RADIUS + 1, self.rows))
+                for x in range(max(cx - STREAM_RADIUS, 0), min(cx + STREAM_RADIUS + 1, self.columns))]
+
+    def update(self, pos):
+        self.collect()
+        wanted = self.around(pos)
+        for chunk in wanted:
+            if chunk not in self.loaded:
+                self.load(chunk)
+            self.loaded.move_to_end(chunk)
+            if chunk in self.ground:
+                self.ground.move_to_end(chunk)
+            elif chunk not in self.baking:
+                self.submit(chunk)
+
+        # evict what hasn't been near the player for the longest time
+        budget = max(CHUNK_BUDGET, len(wanted))
+        while len(self.loaded) > budget:
+            self.unload(next(iter(self.loaded)))
+        while len(self.ground) > budget:
+            self.ground.popitem(last=False)
+
+        if profiler.enabled:
+            profiler.gauge('chunks loaded', len(self.loaded))
+            profiler.gauge('chunks baked', len(self.ground))
+
+    def load(self, chunk):
+        self.loaded[chunk] = True
+        for index in self.chunk_records.get(chunk, ()):
+            self.references[index] = self.references.get(index, 0) + 1
+            if self.references[index] == 1:
+                self.add(index)
+
+    def unload(self, chunk):
+        del self.loaded[chunk]
+        for index in self.chunk_records.get(chunk, ()):
+            self.references[index] -= 1
+            if not self.references[index]:
+                del self.references[index]
+                self.remove(index)
+
+    def add(self, index):
+        order, kind, pos, size, image = self.records[index]
+        group, spatial_hash = self.layers[kind]
+        if image is None:
+            sprite = CollisionSprite(pos, pygame.Surface(size), group)
+            if kind != COLLISION_AREA:
+                sprite.mask = pygame.mask.Mask(size, fill = True)  # areas are solid rects
+        else:
+            sprite = CollisionSprite(pos, self.images[image], group)
+            self.groups.add_static(sprite)
+        spatial_hash.insert(sprite, order)
+        self.sprites[index] = sprite
+
+    def remove(self, index):
+        sprite = self.sprites.pop(index)
+        _, kind, _, _, image = self.records[index]
+        sprite.kill()
+        self.layers[kind][1].remove(sprite)
+        if image is not None:
+            self.groups.remove_static(sprite)
+
+    def submit(self, chunk):
+        # the tile list is read here, the worker only blits
+        left, top = chunk[0] * CHUNK_SIZE, chunk[1] * CHUNK_SIZE
+        tiles = []
+        for y in range(top, min(top + CHUNK_SIZE, self.map.height)):
+            for x in range(left, min(left + CHUNK_SIZE, self.map.width)):
+                image = self.map.tiles[y * self.map.width + x]
+                if image:
+                    if image not in self.tiles:
+                        self.tiles[image] = self.images[image - 1].copy()
+                    tiles.append((self.tiles[image], ((x - left) * TILE_SIZE, (y - top) * TILE_SIZE)))
+        if not tiles:
+            self.ground[chunk] = None
+            return
+        self.baking[chunk] = self.executor.submit(self.bake, tiles)
+
+    def bake(self, tiles):
+        # runs on the worker
+        surf = pygame.Surface((self.chunk_pixels, self.chunk_pixels), 0, self.display_surface)  # display format, no convert pass
+        surf.blits(tiles, False)
+        return surf
+
+    def ground_chunk(self, chunk):
+        # surface to draw for a visible chunk, waits for the worker if it isn't done yet
+        if chunk not in self.ground:
+            if not (0 <= chunk[0] < self.columns and 0 <= chunk[1] < self.rows):
+                return None
+            if chunk not in self.baking:
+                self.submit(chunk)
+            future = self.baking.pop(chunk, None)
+            if future is not None:
+                if profiler.enabled and not future.done():
+                    profiler.count('chunks waited for')
+                self.ground[chunk] = future.result()
+        self.ground.move_to_end(chunk)
+        return self.ground[chunk]
+
+    def collect(self):
+        # finished bakes move into the cache without waiting
+        for chunk, future in list(self.baking.items()):
+            if future.done():
+                del self.baking[chunk]
+                self.ground[chunk] = future.result()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,63 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'code'))
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+from grid import Grid, OPEN, BLOCKED, DANGER
+from hierarchy import ClusterGraph, HierarchicalField
+from pathfinding import FlowField, field_versions
+
+def random_grid(width, height, seed):
+    rng = random.Random(seed)
+    cells = bytes(rng.choices((OPEN, BLOCKED, DANGER), (6, 3, 1), k=width * height))
+    return Grid(width, height, cells)
+
+def walk(field, start, limit):
+    # steps from start to the goal, None when the field gives up or loops
+    cell, steps = start, 0
+    while cell != field.goal:
+        cell = field.step(cell)
+        steps += 1
+        if cell is None or steps > limit:
+            return None
+    return steps
+
+def test_cluster_field_reaches_what_the_flat_field_reaches():
+    # every start cell, unwalkable ones too, has a step in one field exactly when it has one in the other
+    grid = random_grid(200, 160, 1)
+    rng = random.Random(2)
+    for inAir in (False, True):
+        graph = ClusterGraph(grid, inAir)
+        for _ in range(3):
+            goal = (rng.randrange(grid.width), rng.randrange(grid.height))
+            while not grid.can_walk(*goal, inAir):
+                goal = (rng.randrange(grid.width), rng.randrange(grid.height))
+            flat = FlowField(grid, inAir)
+            flat.build(goal)
+            clustered = HierarchicalField(graph, field_versions)
+            clustered.build(goal)
+            for y in range(grid.height):
+                for x in range(grid.width):
+                    if (x, y) == goal:
+                        continue
+                    assert (flat.step((x, y)) is None) == (clustered.step((x, y)) is None), (inAir, goal, (x, y))
+
+def test_cluster_paths_arrive():
+    grid = random_grid(200, 160, 3)
+    rng = random.Random(4)
+    graph = ClusterGraph(grid, False)
+    goal = (100, 80)
+    grid.mark(*goal, 1, 1, OPEN)
+    graph.dirty.append((goal[0], goal[1], 1, 1))
+    graph.update()
+    flat = FlowField(grid, False)
+    flat.build(goal)
+    clustered = HierarchicalField(graph, field_versions)
+    clustered.build(goal)
+    for _ in range(2000):
+        start = (rng.randrange(grid.width), rng.randrange(grid.height))
+        flat_steps = walk(flat, start, grid.width * grid.height)
+        clustered_steps = walk(clustered, start, grid.width * grid.height)
+        assert (flat_steps is None) == (clustered_steps is None), start